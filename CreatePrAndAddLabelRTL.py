@@ -7,22 +7,65 @@ from requests.exceptions import ReadTimeout
 import socket
 import tempfile
 import fileinput
-from flask import Flask, jsonify, request, render_template, url_for, redirect
+from flask import Flask, Response, jsonify, request, render_template, url_for, redirect
+import json
+import hmac
+import hashlib
 import logging
 import time
-import yaml
+import threading
 import queue
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from job_scheduler import JobScheduler, QueueFullError
+from github_client import SharedGithubClient
+from pr_index import OpenPullRequestIndex
+from branch_service import BranchService, BranchHead
+from commit_engine import CommitEngine
+from async_propagation import AsyncPropagationRunner
+from task_store import create_task_store
+from content_cache import ManifestCache
+from git_mirror import GitMirror
+from drift_report import DriftReporter
+from single_flight import KeyedLocks, SingleFlight
+from rate_limit import RateLimitGovernor, BATCH
+from stats import StepTimer
+import metrics
+from propagation_plans import OutcomeCache, PlanStore, Propagation, PropagationPlan, pushed_paths
+from propagation_rules import MissingSourceValue, RuleSet
+from tag_extractor import extract_values
 
 # import ruamel.yaml
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 
-task_results = {}
-task_queue = queue.Queue()
-
-class CreatePRAndAddLabel:
+WORKER_COUNT = int(os.getenv("RTL_WORKER_COUNT", "8"))
+MAX_QUEUE_DEPTH = int(os.getenv("RTL_MAX_QUEUE_DEPTH", "200"))
+BATCH_CONCURRENCY = int(os.getenv("RTL_BATCH_CONCURRENCY", "8"))
+MAX_BATCH_SIZE = int(os.getenv("RTL_MAX_BATCH_SIZE", "200"))
+MAX_STATUS_WAIT = 30
+STATUS_STREAM_TIMEOUT = int(os.getenv("RTL_STATUS_STREAM_TIMEOUT", "55"))
+# Each open status stream or long-poll holds a gunicorn thread; keep this below GUNICORN_THREADS
+MAX_STATUS_WAITERS = int(os.getenv("RTL_MAX_STATUS_WAITERS", "16"))
+PLAN_TTL = int(os.getenv("RTL_PLAN_TTL", "300"))
+OUTCOME_TTL = int(os.getenv("RTL_OUTCOME_TTL", "3600"))
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+# Local mirror mode: manifest reads and branch heads come from a shallow clone of this remote
+MANIFEST_MIRROR_URL = os.getenv("MANIFEST_MIRROR_URL")
+
+task_results = create_task_store(path=os.getenv("RTL_TASK_STORE_PATH"),
+                                 max_size=int(os.getenv("RTL_TASK_STORE_MAX", "10000")),
+                                 ttl=int(os.getenv("RTL_TASK_TTL", "3600")))
+task_queue = queue.Queue(maxsize=MAX_QUEUE_DEPTH)
+scheduler = JobScheduler(task_queue, workers=WORKER_COUNT,
+                         depth_gauge=metrics.QUEUE_DEPTH, running_gauge=metrics.RUNNING_JOBS)
+propagation_timer = StepTimer(("fetch_repository", "check_if_pr_exists", "read_source_files",
+                               "read_target_files", "commit_to_branch", "create_pr", "add_labels"),
+                              "propagation", metrics.STEP_SECONDS)
+# Which keys of which files are propagated between which environments; defaults to image.imageTag, sit -> pre -> prd
+propagation_rules = RuleSet.load(os.getenv("RTL_PROPAGATION_RULES"))
+
+class CreatePRAndAddLabel(Propagation):
     pr_url = None
     pr_created = False
     repo = ""
@@ -31,15 +74,15 @@ class CreatePRAndAddLabel:
     # default_branch = "master"
     git_commit_prefix = "release"
     github_organisation = "devops-pipelines"
-    # application_manifest_repo = "helm-charts-ocp"
+    application_manifest_repo = os.getenv("APPLICATION_MANIFEST_REPO", f"{github_organisation}/helm-charts-ocp")
 
-    num_retries = 10
-    backoff_factor = 15
+    # Transport errors and 5xx only; rate limits are waited out by rate_governor
+    num_retries = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+    backoff_factor = float(os.getenv("GITHUB_BACKOFF_FACTOR", "0.5"))
 
     retry_data = urllib3.util.retry.Retry(total=num_retries, read=num_retries, connect=num_retries,
-                                          backoff_factor=backoff_factor)
-    # github_client = Github(base_url="https://ghe.service.group/api/v3", login_or_token=os.getenv('GITHUB_TOKEN_PSW'),
-    #                        retry=retry_data)
+                                          status=num_retries, status_forcelist=(500, 502, 503, 504),
+                                          backoff_factor=backoff_factor, respect_retry_after_header=False)
 
     errored_messages = []
 
@@ -50,193 +93,399 @@ class CreatePRAndAddLabel:
     # default_branch = "main"
 
     def __init__(self, comp_name, env):
-        self.comp_name = comp_name
-        env_to_be_updated = "pre" if env == "sit" else "prd"
-        app.logger.info(f"Propagation of {self.comp_name} is initiated from {env} to {env_to_be_updated}")
-        self.branch_name = f"{env_to_be_updated}-{comp_name}"
-        self.release_name = f"{env_to_be_updated}-{comp_name}"
-        self.primary_file_path = f"manifests/{comp_name}/{env}/immutable/values.yaml"
-        self.secondary_file_path = f"manifests/{comp_name}/{env_to_be_updated}/immutable/values.yaml"
-
-    def update_image_tag_and_raise_pr(self):
-        repo = self.fetch_repository()
-        self.check_if_pr_exists(repo)
-        image_tag = self.get_image_tag_from_primary_file(repo)
-        secondary_file_content, decoded_secondary_file_content = self.get_secondary_file_content(repo)
-        updated_secondary_file_content, image_tag_is_same = getattr(self, "update_image_tag")(secondary_file_content=decoded_secondary_file_content,
-                                                                                              key="imageTag",
-                                                                                              value=image_tag)
-        # updated_secondary_file_content = self.update_image_tag(decoded_secondary_file_content, image_tag)
-        self.image_tag_is_same = image_tag_is_same
-
+        super().__init__(comp_name, env, propagation_rules)
+        app.logger.info(f"Propagation of {self.comp_name} is initiated from {env} to {self.env_to_be_updated}")
+        self.target_files = {}
+
+    def update_image_tag_and_raise_pr(self, repo=None):
+        repo = repo or self.fetch_repository()
+        # Only one propagation at a time may read, commit to and open a PR for a branch
+        with branch_locks.hold(self.branch_name):
+            plan = plan_store.get(self.branch_name)
+            if plan:
+                updated_files = self.apply_plan(plan)
+            else:
+                updated_files = self.prepare_update(repo)
+
+            if self.image_tag_is_same:
+                app.logger.info(f"message: Image Tag across environments are same, No changes available for propagation")
+            else:
+                self.commit_to_branch(repo, updated_files)
+                self.create_pr(repo)
+
+    def read_state(self, repo, check_pr=True):
+        # Open PR plus every source and target file, read through the PR index, mirror and contents caches
+        if check_pr:
+            self.check_if_pr_exists(repo)
+        source_files = self.read_source_files(repo)
+        self.target_files = self.read_target_files(repo)
+        self.record_reads({path: cached.sha for path, cached in source_files.items()},
+                          {path: cached.sha for path, cached in self.target_files.items()})
+        return source_files
+
+    def prepare_update(self, repo, check_pr=True):
+        # Reads only. Returns {target path: new content} for the files that change.
+        source_files = self.read_state(repo, check_pr)
+        return self.apply_rules({path: cached.decoded_content for path, cached in source_files.items()},
+                                {path: cached.decoded_content for path, cached in self.target_files.items()})
+
+    def describe(self, repo):
+        # Dry run: what update_image_tag_and_raise_pr would do now, from the same cached reads
+        # and without taking the branch lock or writing anything
+        self.prepare_update(repo)
+        changes = []
+        for target_path, updates in self.values.items():
+            current = extract_values(self.target_files[target_path].decoded_content, list(updates))
+            changes.extend({"file": target_path, "key": ".".join(map(str, path)), "current": current.get(path),
+                            "proposed": value, "changed": current.get(path) != value}
+                           for path, value in updates.items())
+        branch_sha = branch_service.branch_sha(repo, self.branch_name)
         if self.image_tag_is_same:
-            app.logger.info(f"message: Image Tag across environments are same, No changes available for propagation")
+            action = "none"
         else:
-            self.check_if_branch_exists(repo)
-            self.commit_to_branch(repo, secondary_file_content, updated_secondary_file_content)
-            self.create_pr(repo)
+            action = "update_pr" if self.pr_created else "create_pr"
+        return {
+            "comp_name": self.comp_name,
+            "env": self.env,
+            "target_env": self.env_to_be_updated,
+            "branch": self.branch_name,
+            "branch_sha": branch_sha,
+            "pr_url": self.pr_url,
+            "action": action,
+            "files": sorted(self.updated_files),
+            "changes": changes,
+            "memoized": outcome_cache.get((self.comp_name, self.env), self.state()),
+        }
 
+    def apply_plan(self, plan):
+        # Outcome of prepare_update worked out earlier from a webhook delivery
+        app.logger.info(f"Using propagation plan for {self.branch_name} computed at {plan.computed_at}")
+        if plan.pr_url:
+            self.pr_url = plan.pr_url
+            self.pr_created = True
+        self.image_tag_is_same = plan.image_tag_is_same
+        self.values = plan.values
+        self.blob_shas = plan.blob_shas
+        self.updated_files = plan.updated_files
+        return plan.updated_files
+
+    def plan(self, repo):
+        started_at = time.time()
+        updated_files = self.prepare_update(repo)
+        return PropagationPlan(self.comp_name, self.env, self.values, updated_files, self.image_tag_is_same,
+                               self.pr_url if self.pr_created else None, self.blob_shas, started_at)
+
+    @propagation_timer.timed("fetch_repository")
     def fetch_repository(self):
+        repo = None
         try:
-            app.logger.info(
-                f"Initiating Connection to GitHub {self.github_organisation}/{self.application_manifest_repo}")
-            # repo = self.github_client.get_organization(self.github_organisation).get_repo(
-            #     self.application_manifest_repo)
-            repo = self.github_client.get_repo(
-                self.application_manifest_repo)
-            app.logger.info(
-                f"Connection to {self.github_organisation}/{self.application_manifest_repo} repo was established")
+            app.logger.info(f"Initiating Connection to GitHub {self.application_manifest_repo}")
+            repo = github_pool.get_repo(self.application_manifest_repo)
+            app.logger.info(f"Connection to {self.application_manifest_repo} repo was established")
         except UnknownObjectException:
-            error = f"[SKIPPING] Repo doesn't exist or have no access-{self.github_organisation}/{self.application_manifest_repo}"
+            error = f"[SKIPPING] Repo doesn't exist or have no access-{self.application_manifest_repo}"
             self.errored_messages.append(error)
             app.logger.error(error)
         return repo
 
+    @propagation_timer.timed("check_if_pr_exists")
     def check_if_pr_exists(self, repo):
-        for pr in repo.get_pulls():
-            if self.branch_name == pr.head.ref:
-                try:
-                    self.pr_url = pr.html_url
-                    self.pr_created = True
-                except UnknownObjectException:
-                    app.logger.error(f"[INFO] File wasn't found")
-
-    def get_image_tag_from_primary_file(self, repo):
-        try:
-            primary_file_content = repo.get_contents(self.primary_file_path, ref=repo.default_branch)
-            primary_file_content_decoded = primary_file_content.decoded_content.decode("utf-8")
-            app.logger.info(
-                f"Content of {self.primary_file_path} after decoding\n\n{primary_file_content_decoded}")
-            parsed_yaml = yaml.safe_load(primary_file_content_decoded)
-            image_tag = parsed_yaml.get("image", {}).get('imageTag')
-            app.logger.info(f"Image tag on {self.primary_file_path} is {image_tag}")
-            return image_tag
-        except FileNotFoundError:
-            app.logger.error(f"Error: File '{self.primary_file_path}' not found.")
-            return None
-        except Exception as e:
-            app.logger.error(f"Error reading YAML file: {e}")
-            return None
-
-    def get_secondary_file_content(self, repo):
-        branch = self.branch_name if self.pr_created else self.default_branch
-        secondary_file_content = repo.get_contents(self.secondary_file_path, ref=branch)
-        decoded_secondary_file_content = secondary_file_content.decoded_content.decode('utf-8')
-        return secondary_file_content, decoded_secondary_file_content
-
-    @staticmethod
-    def update_image_tag(**kwargs):
-        content = kwargs['secondary_file_content']
-        image_tag_is_same = False
-        if not content:
-            return ""
-
-        content_lines = []
-        content_lines = content.split("\n")
-        i = 0
-        while i < len(content_lines):
-            if ':' in content_lines[i] and kwargs["key"] in content_lines[i]:
-                app.logger.info(
-                    f"old image tag \n{content_lines[i]} \n comparing with \n new image tag \n {kwargs['key']}: {kwargs['value']}")
-                if CreatePRAndAddLabel.remove_whitespace(content_lines[i]) == CreatePRAndAddLabel.remove_whitespace(f"{kwargs['key']}: {kwargs['value']}"):
-                    app.logger.info(
-                        "Updating the image_tag_is_same parameter to True as images across environments are same")
-                    image_tag_is_same = True
-                content_lines[i] = f"  {kwargs['key']}: {kwargs['value']}"
-            i += 1
-        content = "\n".join(content_lines)
-        content = "\n".join(list(content.splitlines()))
-        return content, image_tag_is_same
-
-    @staticmethod
-    def remove_whitespace(s):
-        return ''.join(s.split())
-
-    def check_if_branch_exists(self, repo):
+        pr = pr_index.lookup(repo, self.branch_name)
+        if pr:
+            app.logger.info(f"PR already exists for {self.branch_name}: {pr.html_url}")
+            self.pr_url = pr.html_url
+            self.pr_created = True
+
+    @propagation_timer.timed("read_source_files")
+    def read_source_files(self, repo):
+        # {source path: CachedFile}; a missing source file fails the propagation rather than
+        # reading as "nothing to change"
+        contents = {}
+        for _, source_path, _ in self.files:
+            if source_path in contents:
+                continue
+            try:
+                contents[source_path] = read_manifest(repo, source_path, repo.default_branch)
+            except (FileNotFoundError, UnknownObjectException):
+                app.logger.error(f"Error: File '{source_path}' not found.")
+                raise FileNotFoundError(f"{source_path} not found on {repo.default_branch}") from None
+        return contents
+
+    @propagation_timer.timed("read_target_files")
+    def read_target_files(self, repo):
+        branch = self.branch_name if self.pr_created else repo.default_branch
+        return {target_path: read_manifest(repo, target_path, branch) for _, _, target_path in self.files}
+
+    @propagation_timer.timed("commit_to_branch")
+    def commit_to_branch(self, repo, updated_files):
+        # A branch left behind without a PR is restarted from the default branch
         try:
-            branches = [branch.name for branch in repo.get_branches()]
-
-            if not self.pr_created and self.branch_name in branches:
-                app.logger.info(f"Branch {self.branch_name} does not have a associated Pull Requests")
-                repo.get_git_ref(f"heads/{self.branch_name}").delete()
-                app.logger.info(f"Branch {self.branch_name} was deleted")
-                branches.remove(self.branch_name)
-
-            if self.branch_name not in branches:
-                app.logger.info(f"Creating new branch {self.branch_name}")
-                repo_branch = repo.get_branch(repo.default_branch)
-                repo.create_git_ref(f"refs/heads/{self.branch_name}", sha=repo_branch.commit.sha)
-                app.logger.info(f"Branch {self.branch_name} was created")
+            commit_engine.commit_files(repo, self.branch_name, updated_files, self.commit_message,
+                                       reset=not self.pr_created)
+            plan_store.invalidate(self.branch_name)
+            app.logger.info(f"Committed new Image Tag to branch {self.branch_name}")
         except UnknownObjectException as e:
             if "Not Found" in e.data['message']:
                 err = f"[SKIPPING] {repo.name} - branch unable to be created - most likely due to permissions or empty repo"
                 app.logger.error(err)
                 self.errored_messages.append(err)
+            raise
 
-    def commit_to_branch(self, repo, primary_file_content, updated_secondary_file_content):
-        git_method = "update_file"
-        git_method_args = {
-            "content": updated_secondary_file_content,
-            "path": self.secondary_file_path,
-            "branch": self.branch_name,
-            "message": f"{self.git_commit_prefix}: {self.branch_name} - Updating image tag for application {self.comp_name}",
-            "sha": primary_file_content.sha
-        }
-
-        getattr(repo, git_method)(**git_method_args)
-        app.logger.info(f"Committed new Image Tag to branch {self.branch_name}")
-
+    @propagation_timer.timed("create_pr")
     def create_pr(self, repo):
-        title = f"{self.git_commit_prefix}: {self.branch_name} - Update image tag for application {self.comp_name}"
-
         if not self.pr_created:
             try:
-                pr = repo.create_pull(head=self.branch_name, base=repo.default_branch, title=title, body=title)
+                pr = repo.create_pull(head=self.branch_name, base=repo.default_branch, title=self.pr_title,
+                                      body=self.pr_title)
                 app.logger.info(f"PR raised. URL is : {pr.html_url}")
                 self.pr_url = pr.html_url
+                pr_index.record(self.branch_name, pr.number, pr.html_url)
                 self.add_labels(repo, pr)
                 app.logger.info(f"Propagation of PR URL {pr.html_url} completed")
-            except (GithubException, socket.timeout, urllib3.exceptions.ReadTimeoutError) as e:
-                app.logger.error(f"PR Creation timeout - ({repo.name}) - sleeping 60s")
-                app.logger.error(f"Details: {e}")
+            except GithubException as e:
+                if e.status != 422 or "already exists" not in json.dumps(e.data):
+                    app.logger.error(f"PR Creation failed - ({repo.name}) - {e}")
+                    raise
+                # Raised concurrently by someone else: adopt it instead of failing
+                pr = pr_index.lookup(repo, self.branch_name, refresh=True)
+                if pr is None:
+                    app.logger.error(f"PR for {self.branch_name} reported as existing but not found - {e}")
+                    raise
+                self.pr_url = pr.html_url
+                app.logger.info(f"PR for {self.branch_name} already existed: {self.pr_url}")
+            except (socket.timeout, urllib3.exceptions.ReadTimeoutError) as e:
+                app.logger.error(f"PR Creation timeout - ({repo.name}) - {e}")
+                raise
 
+    @propagation_timer.timed("add_labels")
     def add_labels(self, repo, pr):
-        labels = ["canary-pre", "env: pre", f"releaseName: {self.release_name}", f"appname: {self.comp_name}"]
-        issue = repo.get_issue(number=pr.number)
-        issue.set_labels(*labels)
+        pr.set_labels(*self.labels)
         app.logger.info("Added Labels to PR")
 
 
-# @app.before_request
-# def before_request():
-#     request.start_time = time.time()
-#
-#
-# @app.after_request
-# def after_request(response):
-#     end_time = time.time()
-#     duration = end_time - request.start_time
-#     app.logger.info(f"Start Time: " + str(request.start_time))
-#     app.logger.info(f"End Time: " + str(end_time))
-#     app.logger.info(f"Duration: " + str(duration))
-#     return response
+rate_governor = RateLimitGovernor(reserve=int(os.getenv("GITHUB_RATE_RESERVE", "50")),
+                                  batch_reserve=int(os.getenv("GITHUB_BATCH_RATE_RESERVE", "500")),
+                                  max_wait=int(os.getenv("GITHUB_RATE_MAX_WAIT", "60")))
+github_pool = SharedGithubClient(base_url=os.getenv("GITHUB_API_URL", "https://ghe.service.group/api/v3"),
+                                 token=os.getenv('GITHUB_TOKEN_PSW'),
+                                 retry=CreatePRAndAddLabel.retry_data,
+                                 pool_size=WORKER_COUNT,
+                                 repo_ttl=int(os.getenv("GITHUB_REPO_CACHE_TTL", "300")),
+                                 governor=rate_governor,
+                                 response_hook=metrics.observe_github_call)
+pr_index = OpenPullRequestIndex(ttl=int(os.getenv("PR_INDEX_TTL", "30")))
+manifest_mirror = None
+if MANIFEST_MIRROR_URL:
+    manifest_mirror = GitMirror(MANIFEST_MIRROR_URL,
+                                path=os.getenv("MANIFEST_MIRROR_PATH",
+                                               os.path.join(tempfile.gettempdir(), "rtl-manifests.git")),
+                                refresh_interval=int(os.getenv("MANIFEST_MIRROR_REFRESH", "60")),
+                                token=os.getenv('GITHUB_TOKEN_PSW'))
+branch_service = BranchService(default_head_ttl=int(os.getenv("DEFAULT_HEAD_TTL", "15")),
+                               histogram=metrics.STEP_SECONDS, mirror=manifest_mirror)
+commit_engine = CommitEngine(branch_service, histogram=metrics.STEP_SECONDS)
+plan_store = PlanStore(ttl=PLAN_TTL)
+outcome_cache = OutcomeCache(ttl=OUTCOME_TTL)
+branch_locks = KeyedLocks()
+in_flight = SingleFlight()
+status_waiters = threading.BoundedSemaphore(MAX_STATUS_WAITERS)
+manifest_cache = ManifestCache(max_entries=int(os.getenv("CONTENT_CACHE_SIZE", "512")),
+                               max_age=int(os.getenv("CONTENT_CACHE_MAX_AGE", "0")))
+drift_reporter = DriftReporter(propagation_rules, branch_service, manifest_cache, max_workers=BATCH_CONCURRENCY)
+
+
+def read_manifest(repo, path, ref):
+    # The mirror raises LookupError when it cannot answer for ref yet (not cloned, or written since its last fetch)
+    if manifest_mirror is not None:
+        try:
+            return manifest_mirror.get(path, ref)
+        except LookupError:
+            pass
+    return manifest_cache.get(repo, path, ref)
+
+
+async_runner = None
+if os.getenv("RTL_ASYNC_ENGINE", "false").lower() in ("1", "true", "yes"):
+    async_runner = AsyncPropagationRunner(base_url=github_pool.base_url,
+                                          token=github_pool.token,
+                                          repo_full_name=CreatePRAndAddLabel.application_manifest_repo,
+                                          max_in_flight=int(os.getenv("RTL_ASYNC_MAX_IN_FLIGHT", "200")),
+                                          max_pending=MAX_QUEUE_DEPTH,
+                                          governor=rate_governor,
+                                          response_hook=metrics.observe_github_call,
+                                          rules=propagation_rules,
+                                          repo_ttl=github_pool.repo_ttl,
+                                          locks=branch_locks)
+
+
+@app.before_request
+def before_request():
+    request.start_time = time.perf_counter()
+
+
+@app.after_request
+def after_request(response):
+    duration = time.perf_counter() - request.start_time
+    metrics.HTTP_REQUEST_SECONDS.labels(request.url_rule.rule if request.url_rule else "unmatched",
+                                        response.status_code).observe(duration)
+    return response
+
+
+def propagation_outcome(pr_label_creator):
+    if pr_label_creator.image_tag_is_same:
+        return "unchanged"
+    return "pr_updated" if pr_label_creator.pr_created else "pr_created"
+
+
+def propagation_result(pr_label_creator, comp_name, env, settled=False):
+    # settled: the result a repeat of this propagation gets once its changes are in place
+    env_to_be_updated = propagation_rules.target_env(env)
+    image_tag_is_same = pr_label_creator.image_tag_is_same or settled
+    pr_created = pr_label_creator.pr_created or (settled and pr_label_creator.pr_url is not None)
+    if image_tag_is_same and pr_created:
+        return {"message": f"PR for {comp_name} has been raised already and has the same image tag of {env}"}
+    elif image_tag_is_same:
+        return {"message": f"Image Tag across {env} and {env_to_be_updated} are same, No changes available for propagation"}
+    if not pr_label_creator.pr_url:
+        return {"error": f"Changes were committed to {pr_label_creator.branch_name} but no pull request could be found"}
+    return {"pr_url": pr_label_creator.pr_url}
+
+
+def remember_outcome(pr_label_creator):
+    state = pr_label_creator.state(settled=True)
+    if state is not None:
+        outcome_cache.put((pr_label_creator.comp_name, pr_label_creator.env), state,
+                          propagation_result(pr_label_creator, pr_label_creator.comp_name, pr_label_creator.env,
+                                             settled=True))
+
+
+def memoized_outcome(comp_name, env):
+    # Result of an identical propagation that already finished, when the repository is still
+    # in the state it left behind. Costs the cached reads a propagation starts with and never
+    # queues a job; any failure just means the request takes the normal path.
+    if (comp_name, env) not in outcome_cache:
+        return None
+    try:
+        pr_label_creator = CreatePRAndAddLabel(comp_name, env)
+        pr_label_creator.read_state(github_pool.get_repo(CreatePRAndAddLabel.application_manifest_repo))
+        return outcome_cache.get((comp_name, env), pr_label_creator.state())
+    except Exception as e:
+        app.logger.warning(f"Could not check for a memoized outcome of {comp_name} from {env}: {e}")
+        return None
 
 
 def background_task(task_id, comp_name, env):
-    env_to_be_updated = "pre" if env == "sit" else "sit"
     try:
-        pr_label_creator = CreatePRAndAddLabel(comp_name, env)
-        pr_label_creator.update_image_tag_and_raise_pr()
-        if pr_label_creator.image_tag_is_same and pr_label_creator.pr_created:
-            task_results[task_id] = {
-                "message": f"PR for {comp_name} has been raised already and has the same image tag of {env}"}
-        elif pr_label_creator.image_tag_is_same:
-            task_results[task_id] = {
-                "message": f"Image Tag across {env} and {env_to_be_updated} are same, No changes available for propagation"}
-        else:
-            task_results[task_id] = {"pr_url": pr_label_creator.pr_url}
+        with metrics.PROPAGATION_SECONDS.labels("single").time():
+            pr_label_creator = CreatePRAndAddLabel(comp_name, env)
+            pr_label_creator.update_image_tag_and_raise_pr()
+        task_results.set(task_id, propagation_result(pr_label_creator, comp_name, env))
+        remember_outcome(pr_label_creator)
+        metrics.TASK_OUTCOMES.labels("single", propagation_outcome(pr_label_creator)).inc()
+    except Exception as e:
+        task_results.set(task_id, {"error": str(e)})
+        metrics.TASK_OUTCOMES.labels("single", "error").inc()
+        raise
+    finally:
+        in_flight.done((comp_name, env), task_id)
+
+
+def submit_async_propagation(task_id, comp_name, env):
+    def done(pr_label_creator, error):
+        try:
+            if error:
+                app.logger.error(f"Async propagation of {comp_name} failed: {error}")
+                task_results.set(task_id, {"error": str(error)})
+                metrics.TASK_OUTCOMES.labels("async", "error").inc()
+                return
+            # Written through the async engine's own client: update what this process caches
+            # about the branch so later reads (and the outcome cache) see the new state
+            if pr_label_creator.updated_files:
+                plan_store.invalidate(pr_label_creator.branch_name)
+                if manifest_mirror is not None:
+                    manifest_mirror.mark_dirty(pr_label_creator.branch_name)
+            if pr_label_creator.pr_number:
+                pr_index.record(pr_label_creator.branch_name, pr_label_creator.pr_number, pr_label_creator.pr_url)
+            task_results.set(task_id, propagation_result(pr_label_creator, comp_name, env))
+            remember_outcome(pr_label_creator)
+            metrics.TASK_OUTCOMES.labels("async", propagation_outcome(pr_label_creator)).inc()
+        except Exception as e:
+            app.logger.error(f"Recording the async propagation of {comp_name} failed: {e}")
+            task_results.set(task_id, {"error": str(e)})
+        finally:
+            in_flight.done((comp_name, env), task_id)
+
+    async_runner.submit(comp_name, env, done)
+
+
+def background_batch_task(task_id, components, combined):
+    # One repository handle, one open-PR listing and one default branch head for the whole
+    # batch; per-component reads/writes fan out over a capped thread pool.
+    try:
+        with rate_governor.priority(BATCH):
+            repo = github_pool.get_repo(CreatePRAndAddLabel.application_manifest_repo)
+            pr_index.warm(repo)
+            branch_service.default_head(repo)
+        creators = [CreatePRAndAddLabel(item["comp_name"], item["env"]) for item in components]
+
+        def propagate(pr_label_creator):
+            with rate_governor.priority(BATCH):
+                try:
+                    if combined:
+                        return pr_label_creator.prepare_update(repo, check_pr=False), None
+                    pr_label_creator.update_image_tag_and_raise_pr(repo)
+                    remember_outcome(pr_label_creator)
+                    metrics.TASK_OUTCOMES.labels("batch", propagation_outcome(pr_label_creator)).inc()
+                    return None, propagation_result(pr_label_creator, pr_label_creator.comp_name, pr_label_creator.env)
+                except Exception as e:
+                    app.logger.error(f"Propagation of {pr_label_creator.comp_name} in batch {task_id} failed: {e}")
+                    metrics.TASK_OUTCOMES.labels("batch", "error").inc()
+                    return None, {"error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(creators))) as executor:
+            outcomes = list(executor.map(propagate, creators))
+
+        results = []
+        for pr_label_creator, (_, result) in zip(creators, outcomes):
+            results.append({"comp_name": pr_label_creator.comp_name, "env": pr_label_creator.env, **(result or {})})
+
+        if not combined:
+            task_results.set(task_id, {"results": results})
+            return
+
+        changed = [(creator, content) for creator, (content, error) in zip(creators, outcomes)
+                   if error is None and not creator.image_tag_is_same]
+        with rate_governor.priority(BATCH):
+            combined_pr_url = create_combined_pr(repo, task_id, changed) if changed else None
+        for result, pr_label_creator in zip(results, creators):
+            if "error" in result:
+                continue
+            if pr_label_creator.image_tag_is_same:
+                result["message"] = "Image Tag across environments are same, No changes available for propagation"
+            else:
+                result["pr_url"] = combined_pr_url
+            metrics.TASK_OUTCOMES.labels("batch", "unchanged" if pr_label_creator.image_tag_is_same else "pr_created").inc()
+        task_results.set(task_id, {"results": results, "combined_pr_url": combined_pr_url})
     except Exception as e:
-        task_results[task_id] = {"error": str(e)}
+        task_results.set(task_id, {"error": str(e)})
+        raise
+
+
+def create_combined_pr(repo, task_id, changed):
+    env_to_be_updated = changed[0][0].env_to_be_updated
+    comp_names = [creator.comp_name for creator, _ in changed]
+    branch_name = f"{env_to_be_updated}-release-train-{task_id[:8]}"
+    title = f"{CreatePRAndAddLabel.git_commit_prefix}: {branch_name} - Update image tags for {len(comp_names)} applications"
+
+    files = {}
+    for _, updated_files in changed:
+        files.update(updated_files)
+    commit_engine.commit_files(repo, branch_name, files, title, reset=True)
+    pr = repo.create_pull(head=branch_name, base=repo.default_branch, title=title, body="\n".join(comp_names))
+    pr_index.record(branch_name, pr.number, pr.html_url)
+    pr.set_labels("canary-pre", "env: pre", f"releaseName: {branch_name}", *[f"appname: {name}" for name in comp_names])
+    app.logger.info(f"Combined PR for {len(comp_names)} applications raised. URL is : {pr.html_url}")
+    return pr.html_url
 
 
 @app.route('/rtlpropagation/v1.0/createpr', methods=['GET'])
@@ -248,28 +497,291 @@ def create_pr_and_add_labels():
         return render_template('message.html', message="Parameter 'comp_name' is missing"), 400
     if not env:
         return render_template('message.html', message="Parameter 'env' is missing"), 400
-    if env not in ["sit", "pre"]:
-        return render_template('message.html', message="Accepted values are sit and pre"), 400
-
-    task_id = str(time.time())
-    task_results[task_id] = None  # Initialize task result
-    Thread(target=background_task, args=(task_id, comp_name, env)).start()
+    if env not in propagation_rules.promotions:
+        return render_template('message.html',
+                               message=f"Accepted values are {' and '.join(propagation_rules.promotions)}"), 400
+
+    outcome = memoized_outcome(comp_name, env)
+    if outcome:
+        task_id = task_results.create()
+        task_results.set(task_id, outcome)
+        metrics.TASK_OUTCOMES.labels("single", "memoized").inc()
+        app.logger.info(f"Propagation of {comp_name} from {env} has nothing left to do, answered as task {task_id}")
+        return render_template('progress.html', task_id=task_id)
+
+    def start():
+        task_id = task_results.create()
+        try:
+            if async_runner:
+                submit_async_propagation(task_id, comp_name, env)
+            else:
+                scheduler.submit(task_id, background_task, comp_name, env)
+        except QueueFullError:
+            task_results.discard(task_id)
+            raise
+        return task_id
+
+    # Identical requests made while one is queued or running share its task and result
+    try:
+        task_id, joined = in_flight.run((comp_name, env), start)
+    except QueueFullError as e:
+        app.logger.warning(f"Rejected propagation of {comp_name}: {e}")
+        metrics.TASK_OUTCOMES.labels("single", "rejected").inc()
+        return render_template('message.html', message="Too many propagations in progress, please retry shortly"), \
+            429, {"Retry-After": "30"}
+    if joined:
+        metrics.TASK_OUTCOMES.labels("single", "coalesced").inc()
+        app.logger.info(f"Propagation of {comp_name} from {env} is already in progress as task {task_id}")
 
     return render_template('progress.html', task_id=task_id)
 
 
-@app.route('/check_status/<task_id>', methods=['GET'])
-def check_status(task_id):
-    result = task_results.get(task_id)
+@app.route('/rtlpropagation/v1.0/plan', methods=['GET'])
+def propagation_dry_run():
+    comp_name = request.args.get('comp_name')
+    env = request.args.get('env')
+    if not comp_name or env not in propagation_rules.promotions:
+        return jsonify({"error": f"comp_name is required and env must be {' or '.join(propagation_rules.promotions)}"}), 400
+
+    pr_label_creator = CreatePRAndAddLabel(comp_name, env)
+    repo = pr_label_creator.fetch_repository()
+    if repo is None:
+        return jsonify({"error": pr_label_creator.errored_messages[-1]}), 502
+    try:
+        return jsonify(pr_label_creator.describe(repo)), 200
+    except UnknownObjectException as e:
+        return jsonify({"error": f"Manifest not found: {e.data.get('message') if e.data else e}"}), 404
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except MissingSourceValue as e:
+        return jsonify({"error": str(e)}), 422
+
+
+@app.route('/rtlpropagation/v1.0/createpr/batch', methods=['POST'])
+def create_batch_prs():
+    payload = request.get_json(silent=True) or {}
+    components = payload.get("components")
+    combined = bool(payload.get("combined", False))
+
+    if not components or not isinstance(components, list):
+        return jsonify({"error": "Body must contain a non-empty 'components' list"}), 400
+    if len(components) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} components are accepted per batch"}), 400
+    for item in components:
+        if not isinstance(item, dict) or not item.get("comp_name") or item.get("env") not in propagation_rules.promotions:
+            return jsonify({"error": f"Invalid component {item}: comp_name is required and env must be "
+                                     f"{' or '.join(propagation_rules.promotions)}"}), 400
+    if combined and len({item["env"] for item in components}) > 1:
+        return jsonify({"error": "A combined PR needs all components to propagate from the same env"}), 400
+
+    task_id = task_results.create()
+    try:
+        scheduler.submit(task_id, background_batch_task, components, combined)
+    except QueueFullError as e:
+        task_results.discard(task_id)
+        app.logger.warning(f"Rejected batch propagation of {len(components)} components: {e}")
+        metrics.TASK_OUTCOMES.labels("batch", "rejected").inc()
+        return jsonify({"error": "Too many propagations in progress, please retry shortly"}), 429, {"Retry-After": "30"}
+
+    return jsonify({"task_id": task_id, "status_url": url_for('check_status', task_id=task_id)}), 202
+
+
+def webhook_signature_valid(body, signature):
+    # Unsigned deliveries could forge PR urls and the default head, so no secret means no webhook
+    if not WEBHOOK_SECRET:
+        return False
+    expected = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+def precompute_plans(job_id, head, propagations):
+    # Warms the repository, default head, open PR, manifest and plan caches for every
+    # propagation a push affected, so a later /createpr only has writes left to do
+    with rate_governor.priority(BATCH):
+        repo = github_pool.get_repo(CreatePRAndAddLabel.application_manifest_repo)
+    if head:
+        branch_service.record_default_head(repo, head, ttl=PLAN_TTL)
+    if manifest_mirror is not None:
+        # Plans must be computed from the pushed content, not from the previous fetch
+        try:
+            manifest_mirror.refresh()
+        except Exception as e:
+            app.logger.warning(f"Could not refresh the manifest mirror, planning from the API: {e}")
+
+    def plan(comp_name, env):
+        pr_label_creator = CreatePRAndAddLabel(comp_name, env)
+        try:
+            with rate_governor.priority(BATCH):
+                plan_store.put(pr_label_creator.branch_name, pr_label_creator.plan(repo))
+        except Exception as e:
+            app.logger.warning(f"Could not plan propagation of {comp_name} from {env}: {e}")
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(propagations))) as executor:
+        list(executor.map(lambda propagation: plan(*propagation), propagations))
+    app.logger.info(f"Webhook job {job_id} planned {len(propagations)} propagations")
+
+
+def handle_push_event(payload):
+    repo_payload = payload.get("repository") or {}
+    ref = payload.get("ref", "")
+    if not ref.startswith("refs/heads/"):
+        return None
+
+    branch = ref[len("refs/heads/"):]
+    if manifest_mirror is not None:
+        manifest_mirror.mark_dirty(branch)
+        manifest_mirror.request_refresh()
+    if payload.get("deleted") or branch != repo_payload.get("default_branch"):
+        # A push to a propagation branch changes the content its plan was computed from
+        plan_store.invalidate(branch)
+        return None
+
+    paths = pushed_paths(payload)
+    if paths is None:
+        app.logger.info("Push payload does not list every changed path, dropping all propagation plans")
+        plan_store.clear()
+        return None
+
+    propagations = propagation_rules.affected_propagations(paths)
+    for comp_name, env in propagations:
+        plan_store.invalidate(f"{propagation_rules.target_env(env)}-{comp_name}")
+    head_commit = payload.get("head_commit") or {}
+    head = BranchHead(payload["after"], head_commit["tree_id"]) if head_commit.get("tree_id") else None
+    if not propagations:
+        if head:
+            branch_service.record_default_head(github_pool.get_repo(repo_payload["full_name"]), head, ttl=PLAN_TTL)
+        return None
+
+    job_id = f"plan-{payload['after'][:12]}-{int(time.time() * 1000)}"
+    try:
+        scheduler.submit(job_id, precompute_plans, head, sorted(propagations))
+    except QueueFullError as e:
+        app.logger.warning(f"Skipped planning {len(propagations)} propagations: {e}")
+        return None
+    return job_id
+
+
+@app.route('/rtlpropagation/v1.0/webhook', methods=['POST'])
+def github_webhook():
+    if not WEBHOOK_SECRET:
+        return jsonify({"error": "Webhook deliveries are disabled until GITHUB_WEBHOOK_SECRET is configured"}), 403
+    if not webhook_signature_valid(request.get_data(), request.headers.get("X-Hub-Signature-256")):
+        return jsonify({"error": "Invalid signature"}), 401
+
+    event = request.headers.get("X-GitHub-Event")
+    payload = request.get_json(silent=True) or {}
+    repo_name = (payload.get("repository") or {}).get("full_name")
+    if event == "ping":
+        return jsonify({"message": "pong"}), 200
+    if repo_name != CreatePRAndAddLabel.application_manifest_repo:
+        return jsonify({"message": f"Ignoring event for {repo_name}"}), 202
+
+    if event == "pull_request":
+        pr_index.apply_event(payload)
+        plan_store.invalidate((payload.get("pull_request") or {}).get("head", {}).get("ref"))
+        return jsonify({"message": "Pull request index updated"}), 202
+    if event == "push":
+        return jsonify({"job_id": handle_push_event(payload)}), 202
+    return jsonify({"message": f"Ignoring {event} event"}), 202
+
+
+def unknown_task(task_id):
+    # Final answer for ids never issued here or evicted from the task store, so pollers stop
+    return {"error": f"Task {task_id} is unknown or has expired"}
+
+
+def status_payload(task_id, result):
     if result is None:
-        return jsonify({}), 200
+        state = scheduler.state(task_id)
+        return {"state": state} if state else {}
+    if result.get("pr_url"):
+        return {"redirect_url": result["pr_url"]}
     if "pr_url" in result:
-        return jsonify({"redirect_url": result["pr_url"]}), 200
+        return {"message": "The propagation finished without a pull request URL", "html_page": True}
     if "message" in result:
-        return jsonify({"message": result["message"], "html_page": True}), 200
+        return {"message": result["message"], "html_page": True}
     if "error" in result:
-        return jsonify({"message": result["error"], "html_page": True}), 200
-    return jsonify(result), 200
+        return {"message": result["error"], "html_page": True}
+    return result
+
+
+@app.route('/check_status/<task_id>', methods=['GET'])
+def check_status(task_id):
+    # ?wait=N turns this into a long-poll that returns as soon as the task finishes
+    wait = min(request.args.get('wait', 0, type=float), MAX_STATUS_WAIT)
+    if wait > 0 and status_waiters.acquire(blocking=False):
+        try:
+            result = task_results.wait(task_id, wait)
+        finally:
+            status_waiters.release()
+    else:
+        # Every waiter slot is taken: answer now and let the client poll again
+        result = task_results.get(task_id)
+    if result is None and task_id not in task_results:
+        result = unknown_task(task_id)
+    return jsonify(status_payload(task_id, result)), 200
+
+
+@app.route('/stream_status/<task_id>', methods=['GET'])
+def stream_status(task_id):
+    # Server-Sent Events: one connection per job, a single data event when it finishes
+    def events():
+        # Streams are capped in number and duration; past either, the page falls back to polling
+        if not status_waiters.acquire(blocking=False):
+            yield "event: timeout\ndata: {}\n\n"
+            return
+        try:
+            deadline = time.monotonic() + STATUS_STREAM_TIMEOUT
+            while time.monotonic() < deadline:
+                result = task_results.wait(task_id, min(15, deadline - time.monotonic()))
+                if result is None and task_id not in task_results:
+                    result = unknown_task(task_id)
+                if result is not None:
+                    yield f"data: {json.dumps(status_payload(task_id, result))}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+            yield "event: timeout\ndata: {}\n\n"
+        finally:
+            status_waiters.release()
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/rtlpropagation/v1.0/drift', methods=['GET'])
+def drift_report():
+    # ?drifted_only=true limits the matrix to components whose propagated values differ between envs
+    repo = github_pool.get_repo(CreatePRAndAddLabel.application_manifest_repo)
+    report = drift_reporter.report(repo)
+    if request.args.get('drifted_only', 'false').lower() in ("1", "true", "yes"):
+        report = {**report, "components": {name: report["components"][name] for name in report["drifted"]}}
+    return jsonify(report), 200
+
+
+@app.route('/rtlpropagation/v1.0/stats', methods=['GET'])
+def service_stats():
+    return jsonify({
+        "scheduler": scheduler.snapshot(),
+        "pr_index": pr_index.snapshot(),
+        "branches": branch_service.snapshot(),
+        "commits": commit_engine.snapshot(),
+        "manifests": manifest_cache.snapshot(),
+        "plans": plan_store.snapshot(),
+        "outcomes": outcome_cache.snapshot(),
+        "propagation": propagation_timer.snapshot(),
+        "drift": drift_reporter.snapshot(),
+        "in_flight": in_flight.snapshot(),
+        "rate_limit": rate_governor.snapshot(),
+        "mirror": manifest_mirror.snapshot() if manifest_mirror is not None else None,
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if rate_governor.remaining is not None:
+        metrics.RATE_LIMIT_REMAINING.set(rate_governor.remaining)
+    body, content_type = metrics.render()
+    return Response(body, mimetype=content_type)
 
 
 @app.route('/show_message')
@@ -278,5 +790,32 @@ def show_message():
     return render_template('message.html', message=message)
 
 
+def warm_up():
+    # Fork-safe preloading for the WSGI server master: builds the Github client (no
+    # connection is opened until the first request) and compiles the templates
+    github_pool.client
+    for template in ("progress.html", "message.html"):
+        app.jinja_env.get_template(template)
+    if manifest_mirror is not None:
+        # Clone once in the master; workers inherit the refs and start their own refresh loop
+        try:
+            manifest_mirror.refresh()
+        except Exception as e:
+            app.logger.warning(f"Could not clone the manifest mirror: {e}")
+
+
+def drain(timeout):
+    # Lets queued and running propagations finish before the process exits
+    app.logger.info(f"Draining propagation jobs (up to {timeout}s)")
+    drained = scheduler.drain(timeout)
+    if async_runner:
+        drained = async_runner.drain(timeout) and drained
+    if not drained:
+        app.logger.warning("Exiting with propagation jobs still outstanding")
+    return drained
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080)
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.getenv("FLASK_DEBUG", "false").lower() in ("1", "true", "yes"), host='0.0.0.0',
+            port=int(os.getenv("PORT", "8080")), threaded=True)
@@ -0,0 +1,274 @@
+import asyncio
+import base64
+import logging
+import threading
+import time
+from urllib.parse import quote
+
+import httpx
+
+from branch_service import BranchHead
+from commit_engine import write_requests
+from job_scheduler import QueueFullError
+from propagation_plans import Propagation
+from propagation_rules import RuleSet
+from rate_limit import INTERACTIVE
+from single_flight import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGithub:
+    rate_limit_retries = 2
+
+    def __init__(self, base_url, token, max_connections=100, timeout=30, governor=None, response_hook=None,
+                 repo_ttl=300):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"token {token}", "Accept": "application/vnd.github+json"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        self.governor = governor
+        self.response_hook = response_hook
+        self.repo_ttl = repo_ttl
+        self._repos = {}
+
+    async def request(self, verb, path, missing_ok=False, **kwargs):
+        for attempt in range(self.rate_limit_retries + 1):
+            if self.governor:
+                wait = self.governor.delay(INTERACTIVE)
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.governor.delay(INTERACTIVE)
+            start = time.perf_counter()
+            response = await self.client.request(verb, path, **kwargs)
+            if self.response_hook:
+                self.response_hook(verb, response.status_code, time.perf_counter() - start)
+            if not self.governor or not self.governor.observe(
+                    response.status_code, response.headers,
+                    response.text if response.status_code in (403, 429) else ""):
+                break
+        if missing_ok and response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    async def repo(self, full_name):
+        # Re-read after repo_ttl seconds, like SharedGithubClient, so a renamed default branch is picked up
+        cached = self._repos.get(full_name)
+        if cached and time.time() - cached[1] < self.repo_ttl:
+            return cached[0]
+        repo = await self.request("GET", f"/repos/{full_name}")
+        self._repos[full_name] = (repo, time.time())
+        return repo
+
+    async def file(self, full_name, path, ref, missing_ok=False):
+        # (decoded text, blob sha), or None for a missing file when missing_ok
+        data = await self.request("GET", f"/repos/{full_name}/contents/{quote(path)}", params={"ref": ref},
+                                  missing_ok=missing_ok)
+        return (base64.b64decode(data["content"]).decode("utf-8"), data["sha"]) if data else None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AsyncCreatePRAndAddLabel(Propagation):
+    # asyncio counterpart of CreatePRAndAddLabel: same branch lock, reads, rewrite, commit,
+    # PR and labels, but every GitHub call is awaited so one event loop can keep hundreds of
+    # propagations in flight, and reads that do not depend on each other are issued together.
+    lock_poll_interval = 0.05
+
+    def __init__(self, comp_name, env, github, repo_full_name, rules, locks=None):
+        super().__init__(comp_name, env, rules)
+        self.github = github
+        self.repo_full_name = repo_full_name
+        self.locks = locks or KeyedLocks()
+        self.pr_number = None
+
+    async def update_image_tag_and_raise_pr(self):
+        # Shares the threaded engine's branch locks; polled so the event loop never blocks on one
+        while not self.locks.acquire(self.branch_name, blocking=False):
+            await asyncio.sleep(self.lock_poll_interval)
+        try:
+            await self._propagate()
+        finally:
+            self.locks.release(self.branch_name)
+
+    async def _propagate(self):
+        repo = await self.github.repo(self.repo_full_name)
+        default_branch = repo["default_branch"]
+
+        pull, default_head = await asyncio.gather(self.open_pull(), self.branch_head(default_branch))
+        if pull:
+            self.pr_url = pull["html_url"]
+            self.pr_number = pull["number"]
+            self.pr_created = True
+
+        # Every distinct source and target file of the rule set, read concurrently
+        source_paths = list(dict.fromkeys(source_path for _, source_path, _ in self.files))
+        target_paths = list(dict.fromkeys(target_path for _, _, target_path in self.files))
+        files = await asyncio.gather(
+            *[self.github.file(self.repo_full_name, path, default_branch, missing_ok=True)
+              for path in source_paths],
+            *[self.github.file(self.repo_full_name, path, self.branch_name if self.pr_created else default_branch)
+              for path in target_paths],
+        )
+        source_files = dict(zip(source_paths, files))
+        target_files = dict(zip(target_paths, files[len(source_paths):]))
+        for path, file in source_files.items():
+            if file is None:
+                logger.error(f"Error: File '{path}' not found.")
+                raise FileNotFoundError(f"{path} not found on {default_branch}")
+        self.record_reads({path: sha for path, (_, sha) in source_files.items()},
+                          {path: sha for path, (_, sha) in target_files.items()})
+
+        updated_files = self.apply_rules({path: content for path, (content, _) in source_files.items()},
+                                         {path: content for path, (content, _) in target_files.items()})
+        if self.image_tag_is_same:
+            logger.info("Image Tag across environments are same, No changes available for propagation")
+            return
+
+        await self.commit_to_branch(default_branch, default_head, updated_files)
+        if not self.pr_created:
+            await self.create_pr(default_branch)
+
+    async def open_pull(self):
+        owner = self.repo_full_name.split("/")[0]
+        pulls = await self.github.request("GET", f"/repos/{self.repo_full_name}/pulls",
+                                          params={"state": "open", "head": f"{owner}:{self.branch_name}"})
+        return pulls[0] if pulls else None
+
+    async def branch_head(self, branch_name):
+        data = await self.github.request("GET", f"/repos/{self.repo_full_name}/branches/{quote(branch_name)}",
+                                         missing_ok=True)
+        return BranchHead(data["commit"]["sha"], data["commit"]["commit"]["tree"]["sha"]) if data else None
+
+    async def commit_to_branch(self, default_branch, default_head, files):
+        # CommitEngine.commit_files over the async client: a branch left behind without a PR
+        # is restarted from the default branch, and a branch that moves is retried once
+        for attempt in (1, 2):
+            parent = await self.branch_head(self.branch_name) if self.pr_created else None
+            reset = parent is None
+            try:
+                commit_sha = await self._send(write_requests(self.branch_name, parent or default_head, files,
+                                                             self.commit_message, reset))
+                break
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 422 or attempt == 2:
+                    raise
+                logger.warning(f"Branch {self.branch_name} moved while committing, retrying on the new head")
+                default_head = await self.branch_head(default_branch)
+        logger.info(f"Committed new Image Tag to branch {self.branch_name} as {commit_sha[:7]}")
+
+    async def _send(self, requests):
+        response = None
+        while True:
+            try:
+                _, verb, path, body, conflict_expected = requests.send(response)
+            except StopIteration as done:
+                return done.value
+            try:
+                response = await self.github.request(verb, f"/repos/{self.repo_full_name}/{path}", json=body)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 422 or not conflict_expected:
+                    raise
+                response = None
+
+    async def create_pr(self, default_branch):
+        base = f"/repos/{self.repo_full_name}"
+        try:
+            pr = await self.github.request("POST", f"{base}/pulls", json={
+                "head": self.branch_name, "base": default_branch, "title": self.pr_title, "body": self.pr_title})
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 422 or "already exists" not in e.response.text:
+                logger.error(f"PR Creation failed - ({self.repo_full_name}) - {e}")
+                raise
+            # Raised concurrently by someone else: adopt it instead of failing
+            pr = await self.open_pull()
+            if pr is None:
+                logger.error(f"PR for {self.branch_name} reported as existing but not found - {e}")
+                raise
+            self.pr_url = pr["html_url"]
+            self.pr_number = pr["number"]
+            logger.info(f"PR for {self.branch_name} already existed: {self.pr_url}")
+            return
+        self.pr_url = pr["html_url"]
+        self.pr_number = pr["number"]
+        await self.github.request("PUT", f"{base}/issues/{pr['number']}/labels", json={"labels": self.labels})
+        logger.info(f"Propagation of PR URL {self.pr_url} completed")
+
+
+class AsyncPropagationRunner:
+    # Runs an event loop on a background thread so synchronous Flask handlers can hand
+    # propagations to it; at most max_in_flight of them talk to GitHub at once and at most
+    # max_pending are accepted in total before submit() pushes back.
+    def __init__(self, base_url, token, repo_full_name, max_in_flight=200, max_pending=1000, governor=None,
+                 response_hook=None, rules=None, repo_ttl=300, locks=None):
+        self.base_url = base_url
+        self.locks = locks or KeyedLocks()
+        self.repo_ttl = repo_ttl
+        self.rules = rules or RuleSet.load()
+        self.token = token
+        self.governor = governor
+        self.response_hook = response_hook
+        self.repo_full_name = repo_full_name
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.pending = 0
+        self.accepting = True
+        self.loop = None
+        self.github = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="rtl-async-loop", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+
+    async def _setup(self):
+        self.github = AsyncGithub(self.base_url, self.token, max_connections=self.max_in_flight,
+                                  governor=self.governor, response_hook=self.response_hook,
+                                  repo_ttl=self.repo_ttl)
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def _propagate(self, comp_name, env):
+        async with self._semaphore:
+            pr_label_creator = AsyncCreatePRAndAddLabel(comp_name, env, self.github, self.repo_full_name, self.rules,
+                                                        self.locks)
+            await pr_label_creator.update_image_tag_and_raise_pr()
+            return pr_label_creator
+
+    def submit(self, comp_name, env, callback):
+        # callback(pr_label_creator, error) is invoked on the loop thread when the job ends
+        self.start()
+        with self._lock:
+            if not self.accepting:
+                raise QueueFullError("Async engine is shutting down")
+            if self.pending >= self.max_pending:
+                raise QueueFullError(f"{self.pending} async propagations already pending")
+            self.pending += 1
+        future = asyncio.run_coroutine_threadsafe(self._propagate(comp_name, env), self.loop)
+
+        def done(f):
+            with self._lock:
+                self.pending -= 1
+            error = f.exception()
+            callback(None if error else f.result(), error)
+
+        future.add_done_callback(done)
+        return future
+
+    def drain(self, timeout=None):
+        # Stops accepting propagations and waits for the pending ones; False on timeout
+        self.accepting = False
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
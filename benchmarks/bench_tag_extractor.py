@@ -0,0 +1,49 @@
+# Compares reading image.imageTag by loading the whole values file with the pure-Python
+# SafeLoader (what yaml.safe_load does) against the libyaml loader and tag_extractor's
+# partial parse.
+#
+#   python benchmarks/bench_tag_extractor.py --size-kb 500 --repeat 20
+import argparse
+import os
+import sys
+import timeit
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_tag_rewriter import generate_values  # noqa: E402
+from tag_extractor import extract_image_tag  # noqa: E402
+
+
+def full_load(content, loader):
+    return (yaml.load(content, Loader=loader) or {}).get("image", {}).get("imageTag")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-kb", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not hasattr(yaml, "CSafeLoader"):
+        print("PyYAML was built without libyaml; CSafeLoader timings fall back to SafeLoader")
+    c_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    for image_first in (True, False):
+        content = generate_values(args.size_kb, image_first)
+        assert str(full_load(content, yaml.SafeLoader)) == extract_image_tag(content)
+        timings = {
+            "SafeLoader": timeit.timeit(lambda: full_load(content, yaml.SafeLoader), number=args.repeat),
+            "CSafeLoader": timeit.timeit(lambda: full_load(content, c_loader), number=args.repeat),
+            "tag_extractor": timeit.timeit(lambda: extract_image_tag(content), number=args.repeat),
+        }
+        baseline = timings["SafeLoader"]
+        placement = "image block first" if image_first else "image block last"
+        print(f"{len(content) / 1024:.0f} KB, {placement}: " + ", ".join(
+            f"{name} {elapsed / args.repeat * 1000:.2f} ms ({baseline / elapsed:.1f}x)"
+            for name, elapsed in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
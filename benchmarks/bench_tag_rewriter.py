@@ -0,0 +1,59 @@
+# Compares the original line-scan CreatePRAndAddLabel.update_image_tag with tag_rewriter on
+# generated values files.
+#
+#   python benchmarks/bench_tag_rewriter.py --size-kb 500 --repeat 20
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tag_rewriter import rewrite_values  # noqa: E402
+
+
+def legacy_update_image_tag(content, key, value):
+    # Original implementation, minus the logging
+    image_tag_is_same = False
+    content_lines = content.split("\n")
+    i = 0
+    while i < len(content_lines):
+        if ':' in content_lines[i] and key in content_lines[i]:
+            if ''.join(content_lines[i].split()) == ''.join(f"{key}: {value}".split()):
+                image_tag_is_same = True
+            content_lines[i] = f"  {key}: {value}"
+        i += 1
+    content = "\n".join(content_lines)
+    content = "\n".join(list(content.splitlines()))
+    return content, image_tag_is_same
+
+
+def generate_values(size_kb, image_first=True):
+    image = "image:\n  repository: registry.local/team/app\n  imageTag: 1.0.0\n  pullPolicy: IfNotPresent\n"
+    lines = ["configMap:", "  data:", "    application.yaml: |"]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < size_kb * 1024:
+        lines.append(f"      property{i}.name: value-{i}  # not an imageTag")
+        lines.append(f"      property{i}.url: https://service-{i}.internal:8443/api/v1")
+        i += 1
+    body = "\n".join(lines) + "\n"
+    return image + body if image_first else body + image
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-kb", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for image_first in (True, False):
+        content = generate_values(args.size_kb, image_first)
+        legacy = timeit.timeit(lambda: legacy_update_image_tag(content, "imageTag", "2.0.0"), number=args.repeat)
+        rewriter = timeit.timeit(lambda: rewrite_values(content, {"image.imageTag": "2.0.0"}), number=args.repeat)
+        placement = "image block first" if image_first else "image block last"
+        print(f"{len(content) / 1024:.0f} KB, {placement}: legacy {legacy / args.repeat * 1000:.2f} ms, "
+              f"tag_rewriter {rewriter / args.repeat * 1000:.2f} ms ({legacy / rewriter:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+# In-memory stand-in for the parts of the GitHub REST API the propagation service uses
+# (repos, contents, git refs/trees/blobs/commits, branches, pulls, issues/labels), with
+# configurable per-call latency and a seeded repository of any size.
+#
+#   python benchmarks/fake_github.py --port 9000 --components 200 --branches 500 --pulls 100 \
+#       --file-kb 50 --latency 0.05
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+def _sha(kind, data):
+    # git object id, so blob shas match what a real repository reports for the same content
+    return hashlib.sha1(b"%s %d\0" % (kind.encode(), len(data)) + data).hexdigest()
+
+
+class FakeRepository:
+    # Minimal in-memory git object store: flat trees mapping path -> blob sha
+    def __init__(self, full_name="devops-pipelines/helm-charts-ocp", default_branch="master"):
+        self.full_name = full_name
+        self.default_branch = default_branch
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        self.pulls = []
+        self.labels = {}
+        self.lock = threading.RLock()
+        tree = self.put_tree({})
+        self.refs[default_branch] = self.put_commit(tree, [], "initial commit")
+
+    def put_blob(self, data):
+        sha = _sha("blob", data)
+        self.blobs[sha] = data
+        return sha
+
+    def put_tree(self, entries):
+        sha = _sha("tree", json.dumps(sorted(entries.items())).encode())
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def put_commit(self, tree, parents, message):
+        sha = _sha("commit", json.dumps([tree, parents, message, time.time()]).encode())
+        self.commits[sha] = {"tree": tree, "parents": parents, "message": message}
+        return sha
+
+    def files_at(self, branch):
+        return self.trees[self.commits[self.refs[branch]]["tree"]]
+
+    def commit_files(self, branch, files, message="update"):
+        with self.lock:
+            entries = dict(self.files_at(branch))
+            for path, content in files.items():
+                entries[path] = self.put_blob(content.encode() if isinstance(content, str) else content)
+            self.refs[branch] = self.put_commit(self.put_tree(entries), [self.refs[branch]], message)
+            return self.refs[branch]
+
+
+def values_file(image_tag, size_kb=1):
+    lines = ["image:", "  repository: registry.local/team/app", f"  imageTag: {image_tag}", "  pullPolicy: IfNotPresent",
+             "configMap:", "  data:", "    application.yaml: |"]
+    i = 0
+    while sum(len(line) + 1 for line in lines) < size_kb * 1024:
+        lines.append(f"      property{i}.name: value-{i}")
+        lines.append(f"      property{i}.url: https://service-{i}.internal:8443/api/v1")
+        i += 1
+    return "\n".join(lines) + "\n"
+
+
+def seed_repository(components=50, branches=0, pulls=0, file_kb=1, repo=None):
+    # comp-0..comp-N with sit ahead of pre and prd, plus `branches` unrelated branches and
+    # `pulls` open PRs on some of them, so listing calls page as they would on a busy repo
+    repo = repo or FakeRepository()
+    files = {}
+    for i in range(components):
+        for env, tag in (("sit", "1.1.0"), ("pre", "1.0.0"), ("prd", "1.0.0")):
+            files[f"manifests/comp-{i}/{env}/immutable/values.yaml"] = values_file(tag, file_kb)
+    repo.commit_files(repo.default_branch, files, "seed manifests")
+    head = repo.refs[repo.default_branch]
+    for i in range(branches):
+        repo.refs[f"feature-{i}"] = head
+    for i in range(min(pulls, branches)):
+        repo.pulls.append({"number": len(repo.pulls) + 1, "state": "open", "title": f"feature {i}",
+                           "head": f"feature-{i}", "base": repo.default_branch})
+    return repo
+
+
+class FakeGithubServer:
+    # latency is added to every call (plus up to `jitter` seconds at random); the
+    # X-RateLimit-* headers count down from rate_limit per rate_window seconds.
+    def __init__(self, repo=None, latency=0.0, host="localhost", port=0, jitter=0.0, rate_limit=100000,
+                 rate_window=3600):
+        self.repo = repo or FakeRepository()
+        self.host = host
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.window_start = time.time()
+        self.window_base = 0
+        self.calls = Counter()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        # The configured host name, not the bound address: PyGithub checks returned URLs against its base URL
+        return f"http://{self.host}:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PATCH(self):
+                self._dispatch("PATCH")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def _dispatch(self, verb):
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + random.uniform(0, server.jitter))
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null") if length else None
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                path = parsed.path
+                if path.startswith("/api/v3"):
+                    path = path[len("/api/v3"):]
+                for method, pattern, name in ROUTES:
+                    match = re.fullmatch(pattern, path)
+                    if method == verb and match:
+                        server.calls[name] += 1
+                        with server.repo.lock:
+                            status, payload, headers = getattr(server, name)(match, query, body)
+                        return self._send(status, payload, headers)
+                server.calls["unrouted"] += 1
+                self._send(404, {"message": "Not Found"})
+
+            def _send(self, status, payload, headers=None):
+                data = b"" if payload is None else json.dumps(payload).encode()
+                headers = dict(headers or {})
+                if self.command == "GET" and status == 200:
+                    etag = '"%s"' % hashlib.md5(data).hexdigest()
+                    headers["ETag"] = etag
+                    if self.headers.get("If-None-Match") == etag:
+                        status, data = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                remaining, reset = server.rate_limit_state()
+                self.send_header("X-RateLimit-Limit", str(server.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(remaining))
+                self.send_header("X-RateLimit-Reset", str(reset))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def total_calls(self):
+        return sum(count for name, count in self.calls.items() if name != "unrouted")
+
+    # --- helpers -------------------------------------------------------------------------
+
+    def rate_limit_state(self):
+        now = time.time()
+        if now - self.window_start >= self.rate_window:
+            self.window_start = now
+            self.window_base = self.total_calls()
+        used = max(self.total_calls() - self.window_base, 0)
+        return max(self.rate_limit - used, 0), int(self.window_start + self.rate_window)
+
+    def _repo_url(self):
+        return f"{self.url}/repos/{self.repo.full_name}"
+
+    def _repo_json(self):
+        owner, name = self.repo.full_name.split("/")
+        return {"id": 1, "name": name, "full_name": self.repo.full_name, "owner": {"login": owner},
+                "default_branch": self.repo.default_branch, "url": self._repo_url(),
+                "html_url": f"{self.url}/{self.repo.full_name}"}
+
+    def _commit_json(self, sha):
+        commit = self.repo.commits[sha]
+        return {"sha": sha, "url": f"{self._repo_url()}/git/commits/{sha}", "message": commit["message"],
+                "tree": {"sha": commit["tree"], "url": f"{self._repo_url()}/git/trees/{commit['tree']}"},
+                "parents": [{"sha": p} for p in commit["parents"]]}
+
+    def _ref_json(self, branch):
+        return {"ref": f"refs/heads/{branch}", "url": f"{self._repo_url()}/git/refs/heads/{branch}",
+                "object": {"sha": self.repo.refs[branch], "type": "commit"}}
+
+    def _pull_json(self, pr):
+        return {"number": pr["number"], "state": pr["state"], "title": pr["title"],
+                "url": f"{self._repo_url()}/pulls/{pr['number']}",
+                "issue_url": f"{self._repo_url()}/issues/{pr['number']}",
+                "html_url": f"{self.url}/{self.repo.full_name}/pull/{pr['number']}",
+                "head": {"ref": pr["head"], "label": f"{self.repo.full_name.split('/')[0]}:{pr['head']}"},
+                "base": {"ref": pr["base"]}}
+
+    def _paginate(self, items, query, route):
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        chunk = items[(page - 1) * per_page:page * per_page]
+        headers = {}
+        if page * per_page < len(items):
+            headers["Link"] = f'<{self._repo_url()}/{route}?per_page={per_page}&page={page + 1}>; rel="next"'
+        return chunk, headers
+
+    # --- routes --------------------------------------------------------------------------
+
+    def get_repo(self, match, query, body):
+        return 200, self._repo_json(), None
+
+    def get_rate_limit(self, match, query, body):
+        core = {"limit": 5000, "remaining": 4999, "reset": int(time.time()) + 3600}
+        return 200, {"resources": {"core": core, "search": core}, "rate": core}, None
+
+    def get_contents(self, match, query, body):
+        branch = query.get("ref", self.repo.default_branch)
+        path = unquote(match.group(2))
+        if branch not in self.repo.refs:
+            return 404, {"message": "No commit found for the ref"}, None
+        blob = self.repo.files_at(branch).get(path)
+        if blob is None:
+            return 404, {"message": "Not Found"}, None
+        data = self.repo.blobs[blob]
+        return 200, {"type": "file", "encoding": "base64", "path": path, "name": path.rsplit("/", 1)[-1],
+                     "sha": blob, "size": len(data), "content": base64.b64encode(data).decode(),
+                     "url": f"{self._repo_url()}/contents/{path}?ref={branch}"}, None
+
+    def put_contents(self, match, query, body):
+        path = unquote(match.group(2))
+        branch = body.get("branch", self.repo.default_branch)
+        current = self.repo.files_at(branch).get(path)
+        if current and body.get("sha") != current:
+            return 409, {"message": f"{path} does not match {body.get('sha')}"}, None
+        sha = self.repo.commit_files(branch, {path: base64.b64decode(body["content"])}, body["message"])
+        blob = self.repo.files_at(branch)[path]
+        return 200, {"content": {"path": path, "sha": blob, "type": "file"}, "commit": self._commit_json(sha)}, None
+
+    def get_branches(self, match, query, body):
+        items = [{"name": name, "commit": {"sha": sha}} for name, sha in sorted(self.repo.refs.items())]
+        chunk, headers = self._paginate(items, query, "branches")
+        return 200, chunk, headers
+
+    def get_branch(self, match, query, body):
+        branch = unquote(match.group(2))
+        if branch not in self.repo.refs:
+            return 404, {"message": "Branch not found"}, None
+        sha = self.repo.refs[branch]
+        return 200, {"name": branch, "commit": {"sha": sha, "commit": self._commit_json(sha)}}, None
+
+    def get_ref(self, match, query, body):
+        branch = unquote(match.group(2))
+        if branch not in self.repo.refs:
+            return 404, {"message": "Not Found"}, None
+        return 200, self._ref_json(branch), None
+
+    def create_ref(self, match, query, body):
+        branch = body["ref"][len("refs/heads/"):]
+        if branch in self.repo.refs:
+            return 422, {"message": "Reference already exists"}, None
+        if body["sha"] not in self.repo.commits:
+            return 422, {"message": "Object does not exist"}, None
+        self.repo.refs[branch] = body["sha"]
+        return 201, self._ref_json(branch), None
+
+    def update_ref(self, match, query, body):
+        branch = unquote(match.group(2))
+        if branch not in self.repo.refs:
+            return 422, {"message": "Reference does not exist"}, None
+        if not body.get("force") and self.repo.refs[branch] not in self.repo.commits[body["sha"]]["parents"]:
+            return 422, {"message": "Update is not a fast forward"}, None
+        self.repo.refs[branch] = body["sha"]
+        return 200, self._ref_json(branch), None
+
+    def delete_ref(self, match, query, body):
+        branch = unquote(match.group(2))
+        if self.repo.refs.pop(branch, None) is None:
+            return 422, {"message": "Reference does not exist"}, None
+        return 204, None, None
+
+    def create_tree(self, match, query, body):
+        entries = dict(self.repo.trees[body["base_tree"]]) if body.get("base_tree") else {}
+        for item in body["tree"]:
+            if item.get("content") is not None:
+                entries[item["path"]] = self.repo.put_blob(item["content"].encode())
+            elif item.get("sha") is None:
+                entries.pop(item["path"], None)
+            else:
+                entries[item["path"]] = item["sha"]
+        sha = self.repo.put_tree(entries)
+        return 201, {"sha": sha, "url": f"{self._repo_url()}/git/trees/{sha}", "tree": []}, None
+
+    def get_tree(self, match, query, body):
+        sha = match.group(2)
+        if sha in self.repo.commits:
+            sha = self.repo.commits[sha]["tree"]
+        elif sha in self.repo.refs:
+            sha = self.repo.commits[self.repo.refs[sha]]["tree"]
+        if sha not in self.repo.trees:
+            return 404, {"message": "Not Found"}, None
+        entries = [{"path": path, "mode": "100644", "type": "blob", "sha": blob, "size": len(self.repo.blobs[blob]),
+                    "url": f"{self._repo_url()}/git/blobs/{blob}"}
+                   for path, blob in sorted(self.repo.trees[sha].items())]
+        return 200, {"sha": sha, "url": f"{self._repo_url()}/git/trees/{sha}", "tree": entries,
+                     "truncated": False}, None
+
+    def create_blob(self, match, query, body):
+        data = base64.b64decode(body["content"]) if body.get("encoding") == "base64" else body["content"].encode()
+        sha = self.repo.put_blob(data)
+        return 201, {"sha": sha, "url": f"{self._repo_url()}/git/blobs/{sha}"}, None
+
+    def get_blob(self, match, query, body):
+        sha = match.group(2)
+        if sha not in self.repo.blobs:
+            return 404, {"message": "Not Found"}, None
+        data = self.repo.blobs[sha]
+        return 200, {"sha": sha, "size": len(data), "encoding": "base64", "content": base64.b64encode(data).decode(),
+                     "url": f"{self._repo_url()}/git/blobs/{sha}"}, None
+
+    def create_commit(self, match, query, body):
+        if body["tree"] not in self.repo.trees:
+            return 422, {"message": "Tree does not exist"}, None
+        sha = self.repo.put_commit(body["tree"], body.get("parents", []), body["message"])
+        return 201, self._commit_json(sha), None
+
+    def get_commit(self, match, query, body):
+        sha = match.group(2)
+        if sha not in self.repo.commits:
+            return 404, {"message": "Not Found"}, None
+        return 200, self._commit_json(sha), None
+
+    def get_pulls(self, match, query, body):
+        items = [pr for pr in self.repo.pulls if query.get("state", "open") in ("all", pr["state"])]
+        if "head" in query:
+            head = query["head"].split(":", 1)[-1]
+            items = [pr for pr in items if pr["head"] == head]
+        chunk, headers = self._paginate([self._pull_json(pr) for pr in items], query, "pulls")
+        return 200, chunk, headers
+
+    def create_pull(self, match, query, body):
+        if body["head"] not in self.repo.refs:
+            return 422, {"message": "Validation Failed", "errors": [{"field": "head", "code": "invalid"}]}, None
+        if any(pr["head"] == body["head"] and pr["state"] == "open" for pr in self.repo.pulls):
+            return 422, {"message": "Validation Failed",
+                         "errors": [{"message": f"A pull request already exists for {body['head']}."}]}, None
+        pr = {"number": len(self.repo.pulls) + 1, "state": "open", "title": body["title"], "head": body["head"],
+              "base": body["base"]}
+        self.repo.pulls.append(pr)
+        return 201, self._pull_json(pr), None
+
+    def get_issue(self, match, query, body):
+        number = int(match.group(2))
+        return 200, {"number": number, "url": f"{self._repo_url()}/issues/{number}",
+                     "labels": [{"name": label} for label in self.repo.labels.get(number, [])]}, None
+
+    def set_labels(self, match, query, body):
+        number = int(match.group(2))
+        names = body if isinstance(body, list) else body.get("labels", [])
+        self.repo.labels[number] = list(names)
+        return 200, [{"name": label, "url": f"{self._repo_url()}/labels/{label}"} for label in names], None
+
+
+_REPO = r"/repos/([^/]+/[^/]+)"
+ROUTES = [
+    ("GET", r"/rate_limit", "get_rate_limit"),
+    ("GET", _REPO, "get_repo"),
+    ("GET", _REPO + r"/contents/(.+)", "get_contents"),
+    ("PUT", _REPO + r"/contents/(.+)", "put_contents"),
+    ("GET", _REPO + r"/branches", "get_branches"),
+    ("GET", _REPO + r"/branches/(.+)", "get_branch"),
+    ("GET", _REPO + r"/git/ref/heads/(.+)", "get_ref"),
+    ("GET", _REPO + r"/git/refs/heads/(.+)", "get_ref"),
+    ("POST", _REPO + r"/git/refs", "create_ref"),
+    ("PATCH", _REPO + r"/git/refs/heads/(.+)", "update_ref"),
+    ("DELETE", _REPO + r"/git/refs/heads/(.+)", "delete_ref"),
+    ("POST", _REPO + r"/git/trees", "create_tree"),
+    ("GET", _REPO + r"/git/trees/([^/]+)", "get_tree"),
+    ("POST", _REPO + r"/git/blobs", "create_blob"),
+    ("GET", _REPO + r"/git/blobs/([0-9a-f]+)", "get_blob"),
+    ("POST", _REPO + r"/git/commits", "create_commit"),
+    ("GET", _REPO + r"/git/commits/([0-9a-f]+)", "get_commit"),
+    ("GET", _REPO + r"/pulls", "get_pulls"),
+    ("POST", _REPO + r"/pulls", "create_pull"),
+    ("GET", _REPO + r"/issues/(\d+)", "get_issue"),
+    ("PUT", _REPO + r"/issues/(\d+)/labels", "set_labels"),
+    ("POST", _REPO + r"/issues/(\d+)/labels", "set_labels"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--components", type=int, default=50)
+    parser.add_argument("--branches", type=int, default=0)
+    parser.add_argument("--pulls", type=int, default=0)
+    parser.add_argument("--file-kb", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=100000)
+    args = parser.parse_args()
+
+    repo = seed_repository(args.components, args.branches, args.pulls, args.file_kb)
+    server = FakeGithubServer(repo, latency=args.latency, host=args.host, port=args.port, jitter=args.jitter,
+                              rate_limit=args.rate_limit)
+    print(f"Fake GitHub API for {repo.full_name} on {server.url} (GITHUB_API_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
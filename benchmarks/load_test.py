@@ -0,0 +1,187 @@
+# Drives /rtlpropagation/v1.0/createpr and /check_status at increasing request rates and
+# reports end-to-end latency percentiles, GitHub API calls per propagation and the highest
+# rate the service sustained: nothing rejected or failed, p99 under --max-p99 and latency
+# not still climbing by the end of the run (the queue is keeping up).
+#
+# By default the fake GitHub API and the service both run in this process:
+#   python benchmarks/load_test.py --components 200 --latency 0.05 --rates 5,10,20,40 --duration 20
+# or point it at a service already running against benchmarks/fake_github.py:
+#   python benchmarks/load_test.py --target http://localhost:8080 --rates 10,20 --duration 60
+import argparse
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGithubServer, seed_repository, values_file  # noqa: E402
+
+TASK_ID = re.compile(r'const task_id = "([^"]+)"')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class LocalStack:
+    # Fake GitHub plus the Flask app served by werkzeug, both on ephemeral ports
+    def __init__(self, args):
+        from werkzeug.serving import make_server
+
+        self.file_kb = args.file_kb
+        self.repo = seed_repository(args.components, args.branches, args.pulls, args.file_kb)
+        self.github = FakeGithubServer(self.repo, latency=args.latency, jitter=args.jitter).start()
+        os.environ.update({"GITHUB_API_URL": self.github.url, "GITHUB_TOKEN_PSW": "load-test",
+                           "APPLICATION_MANIFEST_REPO": self.repo.full_name,
+                           "RTL_WORKER_COUNT": str(args.workers), "RTL_MAX_QUEUE_DEPTH": str(args.queue_depth)})
+        logging.disable(logging.WARNING)
+        import CreatePrAndAddLabelRTL
+
+        self.server = make_server("localhost", 0, CreatePrAndAddLabelRTL.app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.server.server_port}"
+        self._tag = 0
+        self._lock = threading.Lock()
+
+    def bump(self, comp_name):
+        # A new sit tag before every request, so each propagation has something to write
+        with self._lock:
+            self._tag += 1
+            tag = f"2.0.{self._tag}"
+        self.repo.commit_files(self.repo.default_branch,
+                               {f"manifests/{comp_name}/sit/immutable/values.yaml": values_file(tag, self.file_kb)})
+
+    def api_calls(self):
+        return self.github.total_calls()
+
+
+class LoadGenerator:
+    def __init__(self, target, components, stack=None, poll_wait=25):
+        self.target = target
+        self.components = components
+        self.stack = stack
+        self.poll_wait = poll_wait
+        self._local = threading.local()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def next_component(self):
+        with self._lock:
+            self._next += 1
+            return f"comp-{self._next % self.components}"
+
+    def propagate(self):
+        comp_name = self.next_component()
+        if self.stack:
+            self.stack.bump(comp_name)
+        session = self.session()
+        start = time.perf_counter()
+        response = session.get(f"{self.target}/rtlpropagation/v1.0/createpr",
+                               params={"comp_name": comp_name, "env": "sit"})
+        if response.status_code == 429:
+            return "rejected", time.perf_counter() - start, None
+        match = TASK_ID.search(response.text)
+        if response.status_code != 200 or not match:
+            return "error", time.perf_counter() - start, None
+        while True:
+            status = session.get(f"{self.target}/check_status/{match.group(1)}", params={"wait": self.poll_wait}).json()
+            if status.get("state") in ("queued", "running"):
+                continue
+            outcome = "error" if not status or (status.get("html_page") and "same" not in status["message"]) else "ok"
+            return outcome, time.perf_counter() - start, match.group(1)
+
+    def run(self, rate, duration, concurrency):
+        # Open-loop: requests are started on schedule whether or not earlier ones finished
+        total = int(rate * duration)
+        futures = []
+        calls_before = self.stack.api_calls() if self.stack else None
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i in range(total):
+                delay = started + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(self.propagate))
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for outcome, latency, _ in results if outcome == "ok"]
+        # Identical requests coalesce onto one job, so calls are counted per distinct task
+        jobs = {task_id for outcome, _, task_id in results if outcome == "ok"}
+        quarter = max(len(latencies) // 4, 1)
+        summary = {
+            "rate": rate,
+            "requests": total,
+            "ok": len(latencies),
+            "jobs": len(jobs),
+            "rejected": sum(1 for outcome, _, _ in results if outcome == "rejected"),
+            "errors": sum(1 for outcome, _, _ in results if outcome == "error"),
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "first_quarter_p50": percentile(latencies[:quarter], 0.5),
+            "last_quarter_p50": percentile(latencies[-quarter:], 0.5),
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "api_calls_per_propagation": None,
+        }
+        if self.stack and jobs:
+            summary["api_calls_per_propagation"] = (self.stack.api_calls() - calls_before) / len(jobs)
+        return summary
+
+
+def sustainable(summary, max_p99):
+    if summary["rejected"] or summary["errors"] or summary["p99"] is None or summary["p99"] > max_p99:
+        return False
+    # A backlog that keeps growing shows up as latency rising from the start to the end of the run
+    return summary["last_quarter_p50"] <= 2 * summary["first_quarter_p50"] + 0.1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", help="URL of a running service; by default one is started in-process")
+    parser.add_argument("--rates", default="2,5,10,20", help="comma-separated request rates (jobs/sec)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per rate")
+    parser.add_argument("--concurrency", type=int, default=200, help="client threads")
+    parser.add_argument("--max-p99", type=float, default=10, help="p99 latency (s) still counted as sustainable")
+    parser.add_argument("--components", type=int, default=100)
+    parser.add_argument("--branches", type=int, default=0)
+    parser.add_argument("--pulls", type=int, default=0)
+    parser.add_argument("--file-kb", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake GitHub latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=8, help="RTL_WORKER_COUNT of the in-process service")
+    parser.add_argument("--queue-depth", type=int, default=200, help="RTL_MAX_QUEUE_DEPTH of the in-process service")
+    args = parser.parse_args()
+
+    stack = None if args.target else LocalStack(args)
+    generator = LoadGenerator(args.target or stack.url, args.components, stack)
+    best = None
+    print(f"{'rate':>6} {'ok':>6} {'429':>5} {'err':>5} {'p50 s':>8} {'p99 s':>8} {'jobs/s':>7} {'calls/job':>9}")
+    for rate in (float(value) for value in args.rates.split(",")):
+        summary = generator.run(rate, args.duration, args.concurrency)
+        calls = summary["api_calls_per_propagation"]
+        print(f"{rate:>6g} {summary['ok']:>6} {summary['rejected']:>5} {summary['errors']:>5} "
+              f"{summary['p50'] or 0:>8.3f} {summary['p99'] or 0:>8.3f} {summary['throughput']:>7.2f} "
+              f"{calls if calls is not None else float('nan'):>9.2f}")
+        if sustainable(summary, args.max_p99):
+            best = max(best or 0, rate)
+    print(f"Max sustainable rate: {best:g} jobs/sec" if best else "No rate was sustainable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import quote
+
+from github.GithubException import UnknownObjectException
+
+from stats import StepTimer
+
+logger = logging.getLogger(__name__)
+
+BranchHead = namedtuple("BranchHead", ["commit_sha", "tree_sha"])
+
+
+class BranchService:
+    # Branch lookups through single-ref requests instead of listing every branch. The
+    # default branch head is cached for a short TTL since every propagation branches off it.
+    # Each step's latency is kept in timer and optionally returned per call. With a mirror
+    # (GitMirror) heads are read from the local clone whenever it can answer for the branch.
+    def __init__(self, default_head_ttl=15, histogram=None, mirror=None):
+        self.default_head_ttl = default_head_ttl
+        self.mirror = mirror
+        self.timer = StepTimer(("probe_branch", "branch_head", "default_head"), "branches", histogram)
+        self._default_heads = {}
+        self._lock = threading.Lock()
+
+    def _mirrored_head(self, branch_name):
+        # (True, head) when the mirror holds the branch, (False, None) to ask the API
+        if self.mirror is None:
+            return False, None
+        try:
+            return True, self.mirror.branch_head(branch_name)
+        except LookupError:
+            return False, None
+
+    def branch_sha(self, repo, branch_name, timings=None):
+        known, head = self._mirrored_head(branch_name)
+        if known:
+            return head.commit_sha
+        with self.timer.step("probe_branch", timings):
+            try:
+                _, data = repo._requester.requestJsonAndCheck("GET", f"{repo.url}/git/ref/heads/{quote(branch_name)}")
+            except UnknownObjectException:
+                return None
+        return data["object"]["sha"]
+
+    def branch_head(self, repo, branch_name, timings=None):
+        known, head = self._mirrored_head(branch_name)
+        if known:
+            return head
+        with self.timer.step("branch_head", timings):
+            try:
+                _, data = repo._requester.requestJsonAndCheck("GET", f"{repo.url}/branches/{quote(branch_name)}")
+            except UnknownObjectException:
+                return None
+        return BranchHead(data["commit"]["sha"], data["commit"]["commit"]["tree"]["sha"])
+
+    def default_head(self, repo, timings=None):
+        cached = self._default_heads.get(repo.full_name)
+        if cached and time.time() < cached[1]:
+            return cached[0]
+
+        with self.timer.step("default_head", timings):
+            head = self.branch_head(repo, repo.default_branch)
+        self.record_default_head(repo, head)
+        return head
+
+    def record_default_head(self, repo, head, ttl=None):
+        # Also fed from push webhooks, which carry the new head commit and tree
+        ttl = self.default_head_ttl if ttl is None else ttl
+        with self._lock:
+            self._default_heads[repo.full_name] = (head, time.time() + ttl)
+
+    def invalidate_default_head(self, repo):
+        with self._lock:
+            self._default_heads.pop(repo.full_name, None)
+        if self.mirror is not None:
+            self.mirror.mark_dirty(repo.default_branch)
+
+    def invalidate_branch(self, repo, branch_name):
+        # After a write through the API, until the mirror has fetched it
+        if self.mirror is not None:
+            self.mirror.mark_dirty(branch_name)
+        if branch_name == repo.default_branch:
+            self.invalidate_default_head(repo)
+
+    def snapshot(self):
+        return self.timer.snapshot()
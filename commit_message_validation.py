@@ -1,26 +1,123 @@
-import subprocess
+import argparse
+import contextlib
+import json
+import os
 import re
 import sys
+from collections import namedtuple
 
-# Get the latest commit message
-# commit_message = subprocess.check_output(['git', 'log', '-1', '--pretty=%B']).strip().decode('utf-8')
+# <type>: <JIRA ID> <message>, compiled once for every message checked in this process
+PATTERN = re.compile(r'^(feat|fix|docs|release): [A-Z]+-[0-9]+ .+')
+HINT = "Ensure the message follows the pattern: <type>: <JIRA ID> <message>"
+# Record separator between commits in the `git log` output we parse
+_RECORD_END = "\x1e"
 
+Violation = namedtuple("Violation", ["ref", "subject"])
 
-trigger_payload = <+trigger>
-pr_number = <+trigger.prNumber>  # Replace with actual environment variable if needed
-commit_message = <+trigger.commitMessage>  # Replace with actual env var if needed
 
-print(f"Commit message: {commit_message}")
-print(f"pr_number: {pr_number}")
+def is_valid(message):
+    return isinstance(message, str) and PATTERN.match(message) is not None
 
 
-# Define the regex pattern for the commit message
-pattern = r'^(feat|fix|docs|release): [A-Z]+-[0-9]+ .+'
+def validate(messages):
+    # messages: iterable of (ref, message); returns (number checked, [Violation])
+    checked = 0
+    violations = []
+    for ref, message in messages:
+        checked += 1
+        if not is_valid(message):
+            lines = message.strip().splitlines() if isinstance(message, str) else []
+            violations.append(Violation(ref, lines[0] if lines else ""))
+    return checked, violations
 
-# Check if the commit message matches the pattern
-if re.match(pattern, commit_message):
-    print("Commit message is valid")
-    sys.exit(0)
-else:
-    print("Invalid commit message. Ensure the message follows the pattern: <type>: <JIRA ID> <message>")
-    sys.exit(1)
\ No newline at end of file
+
+def git_log_messages(revision_range, include_merges=False, cwd=None):
+    # (sha, message) for every commit in revision_range, streamed from a single `git log`
+    import subprocess
+
+    command = ["git", "log", f"--format=%H%x00%B{_RECORD_END}"]
+    if not include_merges:
+        command.append("--no-merges")
+    command.append(revision_range)
+    with subprocess.Popen(command, cwd=cwd, stdout=subprocess.PIPE, text=True, encoding="utf-8",
+                          errors="replace") as process:
+        # %B need not end with a newline (Git Data API commits, commit-tree), so records are
+        # split on the separator wherever it falls rather than on lines
+        pending = ""
+        for chunk in iter(lambda: process.stdout.read(65536), ""):
+            *records, pending = (pending + chunk).split(_RECORD_END)
+            for record in records:
+                sha, _, message = record.lstrip("\n").partition("\0")
+                yield sha[:12], message.strip()
+    if process.returncode:
+        raise RuntimeError(f"git log {revision_range} exited with status {process.returncode}")
+
+
+def jsonl_messages(stream):
+    # (ref, message) from JSON lines carrying "message" (or "commit_message") and optionally "sha"/"id"
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield f"line {number}", None
+            continue
+        if isinstance(record, str):
+            yield f"line {number}", record
+            continue
+        if not isinstance(record, dict):
+            # Reported as an invalid message rather than crashing the whole run
+            yield f"line {number}", None
+            continue
+        message = record.get("message", record.get("commit_message"))
+        yield str(record.get("sha") or record.get("id") or f"line {number}"), message
+
+
+def report(checked, violations, out=None):
+    out = out or sys.stdout
+    for violation in violations:
+        out.write(f"{violation.ref}: {violation.subject!r}\n")
+    if violations:
+        out.write(f"{len(violations)} of {checked} commit messages are invalid. {HINT}\n")
+    else:
+        out.write(f"All {checked} commit messages are valid\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate commit messages against " + PATTERN.pattern)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--range", dest="revision_range", help="git revision range, e.g. origin/main..HEAD")
+    source.add_argument("--jsonl", metavar="FILE", help="JSON lines with a 'message' field, '-' for stdin")
+    source.add_argument("--message", help="a single commit message")
+    parser.add_argument("--include-merges", action="store_true", help="also check merge commits in --range")
+    args = parser.parse_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        if args.revision_range:
+            messages = git_log_messages(args.revision_range, args.include_merges)
+        elif args.jsonl:
+            stream = sys.stdin if args.jsonl == "-" else stack.enter_context(open(args.jsonl, encoding="utf-8"))
+            messages = jsonl_messages(stream)
+        else:
+            # Pipeline use: the trigger's commit message is handed over in COMMIT_MESSAGE
+            message = args.message if args.message is not None else os.environ.get("COMMIT_MESSAGE")
+            if message is None:
+                parser.error("one of --range, --jsonl, --message or the COMMIT_MESSAGE variable is required")
+            if os.environ.get("PR_NUMBER"):
+                print(f"pr_number: {os.environ['PR_NUMBER']}")
+            messages = [("message", message)]
+
+        try:
+            checked, violations = validate(messages)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    report(checked, violations)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+
+def git_blob_sha(content):
+    # Sha git (and the contents API) gives a blob holding this text, without asking GitHub
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class CachedFile:
+    __slots__ = ("path", "sha", "decoded_content")
+
+    def __init__(self, path, sha, decoded_content):
+        self.path = path
+        self.sha = sha
+        self.decoded_content = decoded_content
+
+
+class _RefEntry:
+    __slots__ = ("etag", "sha", "validated_at")
+
+    def __init__(self, etag, sha, validated_at):
+        self.etag = etag
+        self.sha = sha
+        self.validated_at = validated_at
+
+
+class ManifestCache:
+    # Contents API cache: (path, ref) -> ETag + blob sha, blob sha -> decoded text shared by
+    # every ref that points at it. Every read is revalidated with If-None-Match (a 304
+    # transfers no body and does not count against the rate limit) unless it was validated
+    # less than max_age seconds ago.
+    def __init__(self, max_entries=512, max_age=0):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self._refs = OrderedDict()
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repo, path, ref, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        key = (path, ref)
+        with self._lock:
+            entry = self._refs.get(key)
+            cached = self._blobs.get(entry.sha) if entry else None
+            if cached and time.time() - entry.validated_at < max_age:
+                self.hits += 1
+                self._touch(key, entry.sha)
+                return cached
+
+        headers = {"If-None-Match": entry.etag} if cached and entry.etag else None
+        response_headers, data = repo._requester.requestJsonAndCheck(
+            "GET", f"{repo.url}/contents/{quote(path)}", parameters={"ref": ref}, headers=headers)
+
+        with self._lock:
+            if data is None:
+                self.hits += 1
+                self.revalidations += 1
+                entry.validated_at = time.time()
+                self._touch(key, entry.sha)
+                return cached
+
+            self.misses += 1
+            cached = self._blobs.get(data["sha"])
+            if cached is None:
+                cached = CachedFile(path, data["sha"], base64.b64decode(data["content"]).decode("utf-8"))
+                self._blobs[data["sha"]] = cached
+            self._refs[key] = _RefEntry(response_headers.get("etag"), data["sha"], time.time())
+            self._touch(key, data["sha"])
+            self._evict()
+            return cached
+
+    def get_blob(self, repo, sha, path=None):
+        # Blobs are immutable, so one already held is returned without any request
+        with self._lock:
+            cached = self._blobs.get(sha)
+            if cached:
+                self.hits += 1
+                self._blobs.move_to_end(sha)
+                return cached
+
+        _, data = repo._requester.requestJsonAndCheck("GET", f"{repo.url}/git/blobs/{sha}")
+        with self._lock:
+            self.misses += 1
+            cached = self._blobs.get(sha)
+            if cached is None:
+                cached = CachedFile(path, sha, base64.b64decode(data["content"]).decode("utf-8"))
+                self._blobs[sha] = cached
+            self._evict()
+            return cached
+
+    def _touch(self, key, sha):
+        self._refs.move_to_end(key)
+        if sha in self._blobs:
+            self._blobs.move_to_end(sha)
+
+    def _evict(self):
+        while len(self._refs) > self.max_entries:
+            self._refs.popitem(last=False)
+        while len(self._blobs) > self.max_entries:
+            self._blobs.popitem(last=False)
+
+    def snapshot(self):
+        return {"refs": len(self._refs), "blobs": len(self._blobs), "hits": self.hits, "misses": self.misses,
+                "revalidations": self.revalidations}
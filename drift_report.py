@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tag_extractor import extract_values
+
+logger = logging.getLogger(__name__)
+
+
+def _dotted(values):
+    return {".".join(path): str(value) for path, value in values.items()}
+
+
+class DriftReporter:
+    # Every propagated value of every component in every environment, read from a single
+    # recursive tree listing of the default branch plus one blob fetch per rule file that is
+    # not cached yet. Files and keys come from the propagation rules, so the report follows
+    # whatever the service propagates. Reports are kept per tree sha: while the default
+    # branch does not move, repeated views cost at most the (TTL-cached) default head lookup.
+    def __init__(self, rules, branch_service, manifest_cache, max_workers=8, max_reports=8):
+        self.rules = rules
+        self.branch_service = branch_service
+        self.manifest_cache = manifest_cache
+        self.max_workers = max_workers
+        self.max_reports = max_reports
+        self.hits = 0
+        self.misses = 0
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def report(self, repo):
+        head = self.branch_service.default_head(repo)
+        cached = self._reports.get(head.tree_sha)
+        if cached:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        _, tree = repo._requester.requestJsonAndCheck("GET", f"{repo.url}/git/trees/{head.tree_sha}",
+                                                      parameters={"recursive": "1"})
+        if tree.get("truncated"):
+            logger.warning(f"Tree {head.tree_sha} of {repo.full_name} was truncated, the drift report is partial")
+        # (rule index, "source" or "target", comp_name, env) -> (path, blob sha)
+        files = {}
+        for entry in tree["tree"]:
+            if entry["type"] != "blob":
+                continue
+            for index, rule in enumerate(self.rules.files):
+                match = rule.source_regex.match(entry["path"])
+                if match and match.group("env") in self.rules.promotions:
+                    files[index, "source", match.group("comp_name"), match.group("env")] = (entry["path"], entry["sha"])
+                match = rule.target_regex.match(entry["path"])
+                if match:
+                    files[index, "target", match.group("comp_name"), match.group("target_env")] = \
+                        (entry["path"], entry["sha"])
+
+        def content(sha):
+            path = paths[sha]
+            try:
+                return self.manifest_cache.get_blob(repo, sha, path).decoded_content
+            except Exception as e:
+                logger.warning(f"Could not read {path}: {e}")
+                return None
+
+        # Identical files share a blob, so each distinct one is fetched once
+        paths = {sha: path for path, sha in files.values()}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(paths)))) as executor:
+            contents = dict(zip(paths, executor.map(content, paths)))
+
+        values = {}
+        for (index, side, comp_name, env), (path, sha) in files.items():
+            rule = self.rules.files[index]
+            keys = [source if side == "source" else target for source, target in rule.keys]
+            try:
+                values[index, side, comp_name, env] = extract_values(contents[sha] or "", keys, rule.patterns)
+            except Exception as e:
+                logger.warning(f"Could not read {path}: {e}")
+                values[index, side, comp_name, env] = {}
+
+        components = {}
+        for (_, _, comp_name, env), found in values.items():
+            components.setdefault(comp_name, dict.fromkeys(self.rules.environments))
+            components[comp_name][env] = {**(components[comp_name][env] or {}), **_dotted(found)}
+        for comp_name, envs in components.items():
+            envs["drift"] = [f"{source}->{target}" for source, target in self.rules.promotions.items()
+                             if self._drifted(comp_name, source, target, values)]
+
+        report = {
+            "commit_sha": head.commit_sha,
+            "tree_sha": head.tree_sha,
+            "generated_at": time.time(),
+            "truncated": bool(tree.get("truncated")),
+            "components": dict(sorted(components.items())),
+            "drifted": sorted(name for name, envs in components.items() if envs["drift"]),
+        }
+        with self._lock:
+            self._reports[head.tree_sha] = report
+            while len(self._reports) > self.max_reports:
+                self._reports.pop(next(iter(self._reports)))
+        return report
+
+    def _drifted(self, comp_name, source_env, target_env, values):
+        # A propagation from source_env would change a value in target_env
+        for index, rule in enumerate(self.rules.files):
+            source = values.get((index, "source", comp_name, source_env))
+            if not source:
+                continue
+            target = values.get((index, "target", comp_name, target_env), {})
+            pairs = [(source_key, target_key) for source_key, target_key in rule.keys if source_key in source]
+            # Wildcard keys are only copied into scalars the target already has
+            exact = {source_key for source_key, _ in rule.keys}
+            pairs += [(path, path) for path in source if path not in exact and path in target]
+            if any(str(source[source_key]) != str(target.get(target_key)) for source_key, target_key in pairs):
+                return True
+        return False
+
+    def snapshot(self):
+        return {"reports": len(self._reports), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,173 @@
+import base64
+import fcntl
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from branch_service import BranchHead
+from content_cache import CachedFile
+
+logger = logging.getLogger(__name__)
+
+
+class StaleMirror(LookupError):
+    pass
+
+
+class GitMirror:
+    # Bare, shallow clone of the manifest repository. File contents at a branch and branch
+    # heads are answered from the local object store through one long-lived
+    # `git cat-file --batch` process. The clone is fetched every refresh_interval seconds
+    # or as soon as request_refresh() is called (push webhook). A branch written through
+    # REST since the last fetch is marked dirty: lookups for it raise StaleMirror and
+    # callers fall back to the API until a later fetch has picked the write up. Processes
+    # on one host share the clone; clone/fetch are serialised with a lock file.
+    def __init__(self, remote_url, path, refresh_interval=60, depth=1, token=None, max_files=1024):
+        self.remote_url = remote_url
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.depth = depth
+        self.token = token
+        self.max_files = max_files
+        self.fetched_at = 0
+        self.counters = {"fetches": 0, "failed_fetches": 0, "hits": 0, "fallbacks": 0}
+        self._heads = None
+        self._dirty = {}
+        self._files = OrderedDict()
+        self._batch = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._batch_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def start(self):
+        # Started lazily from the first lookup so that a pre-forking server does not lose it on fork
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, name="rtl-git-mirror", daemon=True)
+            self._thread.start()
+
+    def request_refresh(self):
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                self.counters["failed_fetches"] += 1
+                logger.error(f"Refreshing the manifest mirror at {self.path} failed: {e}")
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def refresh(self):
+        started_at = time.time()
+        with self._refresh_lock, open(self.path.rstrip("/") + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            depth = ["--depth", str(self.depth)] if self.depth else []
+            if not os.path.isdir(os.path.join(self.path, "objects")):
+                self._git("clone", "--bare", "--no-single-branch", *depth, self.remote_url, self.path, cwd=None)
+            else:
+                self._git("fetch", "--prune", "--quiet", *depth, "origin", "+refs/heads/*:refs/heads/*")
+            heads = {}
+            for line in self._git("for-each-ref", "--format=%(refname:strip=2) %(objectname) %(tree)",
+                                  "refs/heads").splitlines():
+                name, commit_sha, tree_sha = line.rsplit(" ", 2)
+                heads[name] = BranchHead(commit_sha, tree_sha)
+
+        with self._batch_lock:
+            # New packs are picked up by a fresh cat-file process
+            self._close_batch()
+        with self._lock:
+            self._heads = heads
+            self._dirty = {branch: marked_at for branch, marked_at in self._dirty.items() if marked_at >= started_at}
+            self.fetched_at = time.time()
+            self.counters["fetches"] += 1
+        logger.info(f"Manifest mirror refreshed: {len(heads)} branches in {time.time() - started_at:.2f}s")
+
+    def mark_dirty(self, branch_name):
+        with self._lock:
+            self._dirty[branch_name] = time.time()
+
+    def branch_head(self, branch_name):
+        # BranchHead, or StaleMirror if this mirror cannot tell. A branch missing from the last
+        # fetch may have been created since, so absence is left for the API to confirm.
+        self.start()
+        with self._lock:
+            if self._heads is None:
+                self.counters["fallbacks"] += 1
+                raise StaleMirror("The manifest mirror has not been cloned yet")
+            if branch_name in self._dirty:
+                self.counters["fallbacks"] += 1
+                raise StaleMirror(f"{branch_name} was written since the last fetch")
+            head = self._heads.get(branch_name)
+            if head is None:
+                self.counters["fallbacks"] += 1
+                raise StaleMirror(f"{branch_name} was not in the last fetch")
+            self.counters["hits"] += 1
+            return head
+
+    def get(self, path, ref):
+        # Same result type as ManifestCache.get, read from the local object store;
+        # FileNotFoundError only for a path missing on a branch the mirror holds
+        head = self.branch_head(ref)
+        key = (head.commit_sha, path)
+        with self._lock:
+            cached = self._files.get(key)
+            if cached:
+                self._files.move_to_end(key)
+                return cached
+
+        sha, data = self._cat_file(f"{head.commit_sha}:{path}")
+        if sha is None:
+            raise FileNotFoundError(f"{path} not found on {ref}")
+        cached = CachedFile(path, sha, data.decode("utf-8"))
+        with self._lock:
+            self._files[key] = cached
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return cached
+
+    def _cat_file(self, spec):
+        with self._batch_lock:
+            if self._batch is None:
+                self._batch = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.path,
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._batch.stdin.write(spec.encode() + b"\n")
+            self._batch.stdin.flush()
+            header = self._batch.stdout.readline().decode().split()
+            if len(header) != 3:
+                return None, None
+            sha, _, size = header
+            data = self._batch.stdout.read(int(size) + 1)[:-1]
+            return sha, data
+
+    def _close_batch(self):
+        if self._batch is not None:
+            self._batch.stdin.close()
+            self._batch.wait()
+            self._batch = None
+
+    def _git(self, *args, cwd=True):
+        env = None
+        if self.token and self.remote_url.startswith("http"):
+            # Handed over in the environment (git >= 2.31) so the token never shows in the process list
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode()).decode()
+            env = {**os.environ, "GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "http.extraHeader",
+                   "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}"}
+        result = subprocess.run(["git", *args], cwd=self.path if cwd else None, env=env,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise RuntimeError(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result.stdout
+
+    def snapshot(self):
+        with self._lock:
+            return {"branches": len(self._heads or {}), "dirty": len(self._dirty),
+                    "seconds_since_fetch": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+                    **self.counters}
@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+
+import requests
+from github import Github
+from github.Requester import Requester, RequestsResponse
+
+logger = logging.getLogger(__name__)
+
+
+class PooledHTTPSConnection:
+    # Drop-in for PyGithub's HTTPSRequestsConnectionClass. Every instance talks through one
+    # keep-alive requests.Session per host, so the retry policy and pool size are applied
+    # once for the whole process. Requester may hand the same instance to several threads,
+    # so the pending request lives in a thread local. With a governor configured every call
+    # is budgeted against the rate limit and rate-limited responses are retried after the
+    # wait GitHub asks for.
+    protocol = "https"
+    default_port = 443
+    retry = None
+    pool_size = requests.adapters.DEFAULT_POOLSIZE
+    governor = None
+    response_hook = None
+    rate_limit_retries = 2
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = self.shared_session(host, self.port)
+        self._pending = threading.local()
+
+    @classmethod
+    def configure(cls, retry=None, pool_size=None, governor=None, response_hook=None):
+        # response_hook(verb, status, seconds) is called after every HTTP exchange
+        PooledHTTPSConnection.retry = retry
+        PooledHTTPSConnection.governor = governor
+        PooledHTTPSConnection.response_hook = staticmethod(response_hook) if response_hook else None
+        if pool_size:
+            PooledHTTPSConnection.pool_size = pool_size
+
+    @classmethod
+    def shared_session(cls, host, port):
+        key = (cls.protocol, host, port)
+        with cls._sessions_lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    max_retries=cls.retry if cls.retry is not None else requests.adapters.DEFAULT_RETRIES,
+                    pool_connections=1,
+                    pool_maxsize=cls.pool_size,
+                )
+                session.mount(f"{cls.protocol}://", adapter)
+                cls._sessions[key] = session
+                logger.info(f"Opened GitHub connection pool to {host}:{port} (size {cls.pool_size})")
+            return session
+
+    def request(self, verb, url, input, headers):
+        self._pending.args = (verb, url, input, headers)
+
+    def getresponse(self):
+        verb, url, input, headers = self._pending.args
+        for attempt in range(self.rate_limit_retries + 1):
+            if self.governor:
+                self.governor.acquire()
+            start = time.perf_counter()
+            r = getattr(self.session, verb.lower())(
+                f"{self.protocol}://{self.host}:{self.port}{url}",
+                headers=headers,
+                data=input,
+                timeout=self.timeout,
+                verify=self.verify,
+                allow_redirects=False,
+            )
+            if self.response_hook:
+                self.response_hook(verb, r.status_code, time.perf_counter() - start)
+            if not self.governor or not self.governor.observe(r.status_code, r.headers,
+                                                              r.text if r.status_code in (403, 429) else ""):
+                break
+        return RequestsResponse(r)
+
+    def close(self):
+        return
+
+
+class PooledHTTPConnection(PooledHTTPSConnection):
+    protocol = "http"
+    default_port = 80
+
+
+class SharedGithubClient:
+    # Process-wide Github client plus a TTL cache of Repository handles, so jobs neither
+    # re-handshake with GitHub nor re-fetch repository metadata (default_branch etc.).
+    def __init__(self, base_url, token, retry=None, pool_size=None, repo_ttl=300, governor=None, response_hook=None):
+        self.base_url = base_url
+        self.token = token
+        self.retry = retry
+        self.pool_size = pool_size
+        self.governor = governor
+        self.response_hook = response_hook
+        self.repo_ttl = repo_ttl
+        self._client = None
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    PooledHTTPSConnection.configure(retry=self.retry, pool_size=self.pool_size, governor=self.governor,
+                                                    response_hook=self.response_hook)
+                    Requester.injectConnectionClasses(PooledHTTPConnection, PooledHTTPSConnection)
+                    self._client = Github(base_url=self.base_url, login_or_token=self.token)
+        return self._client
+
+    def get_repo(self, full_name):
+        cached = self._repos.get(full_name)
+        if cached and time.time() - cached[1] < self.repo_ttl:
+            return cached[0]
+
+        repo = self.client.get_repo(full_name)
+        self._repos[full_name] = (repo, time.time())
+        logger.info(f"Cached repository handle for {full_name} (default branch {repo.default_branch})")
+        return repo
+
+    def invalidate(self, full_name=None):
+        if full_name is None:
+            self._repos.clear()
+        else:
+            self._repos.pop(full_name, None)
@@ -12,12 +12,18 @@ import queue
 from threading import Thread
 from github import Github
 from github.GithubException import UnknownObjectException
+from github_client import SharedGithubClient
+from branch_service import BranchService
+from commit_engine import CommitEngine
+from task_store import MemoryTaskStore
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 
-task_results = {}
+task_results = MemoryTaskStore()
 task_queue = queue.Queue()
+github_pool = SharedGithubClient(base_url="https://api.github.com", token=os.getenv('GITHUB_TOKEN_PSW'))
+commit_engine = CommitEngine(BranchService())
 
 class CreatePRAndAddLabel:
     def __init__(self, comp_name, env):
@@ -36,7 +42,7 @@ class CreatePRAndAddLabel:
 
     def connect_to_github(self):
         try:
-            return Github(base_url="https://api.github.com", login_or_token=os.getenv('GITHUB_TOKEN_PSW'))
+            return github_pool.client
         except Exception as e:
             app.logger.error(f"Error connecting to GitHub: {e}")
             return None
@@ -72,7 +78,7 @@ class CreatePRAndAddLabel:
 
     def fetch_repository(self):
         try:
-            self.repo = self.github_client.get_repo("devops-pipelines/helm-charts-ocp")
+            self.repo = github_pool.get_repo("devops-pipelines/helm-charts-ocp")
         except UnknownObjectException:
             app.logger.error("Repository not found or access denied.")
 
@@ -154,8 +160,8 @@ class CreatePRAndAddLabel:
             return
 
         try:
-            self.repo.update_file(self.secondary_file_path, f"{self.git_commit_prefix}: {self.branch_name} - Updating image tag for application {self.comp_name}",
-                                  content, sha=self.repo.get_contents(self.primary_file_path, ref=self.repo.default_branch).sha, branch=self.branch_name)
+            commit_engine.commit_files(self.repo, self.branch_name, {self.secondary_file_path: content},
+                                       f"{self.git_commit_prefix}: {self.branch_name} - Updating image tag for application {self.comp_name}")
             app.logger.info(f"Committed new image tag to branch: {self.branch_name}")
         except Exception as e:
             app.logger.error(f"Error while committing to branch: {e}")
@@ -192,15 +198,15 @@ def background_task(task_id, comp_name, env):
         pr_label_creator = CreatePRAndAddLabel(comp_name, env)
         pr_label_creator.update_image_tag_and_raise_pr()
         if pr_label_creator.image_tag_is_same and pr_label_creator.pr_created:
-            task_results[task_id] = {
-                "message": f"PR for {comp_name} has already been raised and has the same image tag of {env}"}
+            task_results.set(task_id, {
+                "message": f"PR for {comp_name} has already been raised and has the same image tag of {env}"})
         elif pr_label_creator.image_tag_is_same:
-            task_results[task_id] = {
-                "message": f"Image Tag across {env} and {env_to_be_updated} are same, No changes available for propagation"}
+            task_results.set(task_id, {
+                "message": f"Image Tag across {env} and {env_to_be_updated} are same, No changes available for propagation"})
         else:
-            task_results[task_id] = {"pr_url": pr_label_creator.pr_url}
+            task_results.set(task_id, {"pr_url": pr_label_creator.pr_url})
     except Exception as e:
-        task_results[task_id] = {"error": str(e)}
+        task_results.set(task_id, {"error": str(e)})
 
 @app.route('/rtlpropagation/v1.0/createpr', methods=['GET'])
 def create_pr_and_add_labels():
@@ -214,8 +220,7 @@ def create_pr_and_add_labels():
     if env not in ["sit", "pre"]:
         return render_template('message.html', message="Accepted values are sit and pre"), 400
 
-    task_id = str(time.time())
-    task_results[task_id] = None  # Initialize task result
+    task_id = task_results.create()
     Thread(target=background_task, args=(task_id, comp_name, env)).start()
 
     return render_template('progress.html', task_id=task_id)
@@ -0,0 +1,52 @@
+# gunicorn -c gunicorn.conf.py CreatePrAndAddLabelRTL:app
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# One worker by default: branch locks, in-flight coalescing, the plan store, the outcome cache
+# and the open PR index live in process memory, so with several workers two of them may
+# propagate the same component at once and plans/outcomes are only found on the worker that
+# made them. Only raise WEB_CONCURRENCY behind a single propagation entry point.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Threads serve status polls and SSE streams; propagations run on the worker's job scheduler.
+# At most RTL_MAX_STATUS_WAITERS threads are held by streams/long-polls at a time.
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = 5
+preload_app = True
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+if workers > 1:
+    # A task may be polled on any worker, so results go to a store they all share, and
+    # Prometheus samples are merged across processes. Both must be set before the app loads.
+    os.environ.setdefault("RTL_TASK_STORE_PATH", os.path.join(tempfile.gettempdir(), "rtl-tasks.sqlite3"))
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="rtl-metrics-"))
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} workers x {threads} threads")
+
+
+def when_ready(server):
+    import CreatePrAndAddLabelRTL
+
+    CreatePrAndAddLabelRTL.warm_up()
+
+
+def worker_exit(server, worker):
+    # Requests have stopped; give accepted propagations the rest of the graceful timeout
+    import CreatePrAndAddLabelRTL
+
+    CreatePrAndAddLabelRTL.drain(max(graceful_timeout - 10, 1))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
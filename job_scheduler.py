@@ -0,0 +1,159 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from stats import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, target, args):
+        self.job_id = job_id
+        self.target = target
+        self.args = args
+        self.state = QUEUED
+        self.error = None
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "error": self.error,
+            "enqueued_at": self.enqueued_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobScheduler:
+    # Fixed-size pool of worker threads draining a bounded task queue. Submitting to a
+    # full queue raises QueueFullError so callers can push back on the client (HTTP 429).
+    # depth_gauge/running_gauge, when given, are Prometheus gauges kept current.
+    def __init__(self, task_queue, workers=8, history_size=1000, depth_gauge=None, running_gauge=None):
+        self.task_queue = task_queue
+        self.workers = workers
+        self.history_size = history_size
+        self.depth_gauge = depth_gauge
+        self.running_gauge = running_gauge
+        self.accepting = True
+        self.jobs = OrderedDict()
+        self.wait_stats = LatencyStats()
+        self.run_stats = LatencyStats()
+        self.counters = {"submitted": 0, "rejected": 0, DONE: 0, FAILED: 0}
+        self._running = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"rtl-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Started {self.workers} propagation workers")
+
+    def submit(self, job_id, target, *args):
+        # Workers are started lazily so that a pre-forking server does not lose them on fork
+        self.start()
+        if not self.accepting:
+            raise QueueFullError("Worker is shutting down")
+        job = Job(job_id, target, args)
+        try:
+            self.task_queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.counters["rejected"] += 1
+            raise QueueFullError(f"Task queue is full ({self.task_queue.maxsize} jobs waiting)")
+
+        with self._lock:
+            self.counters["submitted"] += 1
+            self.jobs[job_id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+        self._update_gauges()
+        return job
+
+    def drain(self, timeout=None):
+        # Stops accepting jobs and waits for the queued and running ones to finish.
+        # Returns False if some were still outstanding after timeout seconds.
+        self.accepting = False
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.task_queue.all_tasks_done:
+            while self.task_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.task_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def state(self, job_id):
+        job = self.jobs.get(job_id)
+        return job.state if job else None
+
+    def _worker(self):
+        while True:
+            job = self.task_queue.get()
+            try:
+                self._run(job)
+            finally:
+                self.task_queue.task_done()
+
+    def _run(self, job):
+        job.started_at = time.time()
+        job.state = RUNNING
+        self.wait_stats.observe(job.started_at - job.enqueued_at)
+        with self._lock:
+            self._running += 1
+        self._update_gauges()
+
+        try:
+            job.target(job.job_id, *job.args)
+            job.state = DONE
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+            logger.exception(f"Job {job.job_id} failed")
+        finally:
+            job.finished_at = time.time()
+            self.run_stats.observe(job.finished_at - job.started_at)
+            with self._lock:
+                self._running -= 1
+                self.counters[job.state] += 1
+            self._update_gauges()
+
+    def _update_gauges(self):
+        if self.depth_gauge is not None:
+            self.depth_gauge.set(self.task_queue.qsize())
+        if self.running_gauge is not None:
+            self.running_gauge.set(self._running)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            running = self._running
+        return {
+            "workers": self.workers,
+            "queue_depth": self.task_queue.qsize(),
+            "max_queue_depth": self.task_queue.maxsize,
+            "running": running,
+            **counters,
+            "queue_wait_seconds": self.wait_stats.snapshot(),
+            "run_seconds": self.run_stats.snapshot(),
+        }
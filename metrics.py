@@ -0,0 +1,36 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+STEP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STEP_SECONDS = Histogram("rtl_step_seconds", "Latency of each propagation step", ["component", "step"],
+                         buckets=STEP_BUCKETS)
+PROPAGATION_SECONDS = Histogram("rtl_propagation_seconds", "End-to-end latency of a propagation job", ["kind"],
+                                buckets=STEP_BUCKETS)
+GITHUB_CALLS = Counter("rtl_github_api_calls_total", "GitHub API calls by method and response status",
+                       ["method", "status"])
+GITHUB_CALL_SECONDS = Histogram("rtl_github_api_call_seconds", "GitHub API call latency", ["method"],
+                                buckets=STEP_BUCKETS)
+HTTP_REQUEST_SECONDS = Histogram("rtl_http_request_seconds", "Latency of this service's HTTP endpoints",
+                                 ["endpoint", "status"], buckets=STEP_BUCKETS)
+TASK_OUTCOMES = Counter("rtl_tasks_total", "Propagation requests by kind and outcome", ["kind", "outcome"])
+QUEUE_DEPTH = Gauge("rtl_queue_depth", "Jobs waiting for a propagation worker", multiprocess_mode="livesum")
+RUNNING_JOBS = Gauge("rtl_running_jobs", "Jobs currently being processed", multiprocess_mode="livesum")
+RATE_LIMIT_REMAINING = Gauge("rtl_github_rate_limit_remaining", "GitHub API calls left in the current window",
+                             multiprocess_mode="min")
+
+
+def observe_github_call(method, status, seconds):
+    GITHUB_CALLS.labels(method, status).inc()
+    GITHUB_CALL_SECONDS.labels(method).observe(seconds)
+
+
+def render():
+    # With PROMETHEUS_MULTIPROC_DIR set (several gunicorn workers) every process's samples are merged
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+OpenPullRequest = namedtuple("OpenPullRequest", ["number", "html_url", "head_ref"])
+
+
+class _Entry:
+    __slots__ = ("pr", "etag", "checked_at")
+
+    def __init__(self, pr, etag, checked_at):
+        self.pr = pr
+        self.etag = etag
+        self.checked_at = checked_at
+
+
+class OpenPullRequestIndex:
+    # head ref -> open PR map for one repository. Fresh entries answer without touching
+    # GitHub; stale ones are revalidated with a conditional `head=owner:branch` query, which
+    # costs a 304 (not counted against the rate limit) when nothing changed. Webhook
+    # pull_request events and our own create_pull keep the map current in between.
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._listed_at = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, repo, branch_name, refresh=False):
+        # refresh=True always asks GitHub (conditionally), e.g. after a create_pull said the PR exists
+        now = time.time()
+        entry = self._entries.get(branch_name)
+        if not refresh and entry and now - entry.checked_at < self.ttl:
+            self.hits += 1
+            return entry.pr
+        if not refresh and entry is None and now - self._listed_at < self.ttl:
+            # Not present in a fresh full listing, so there is no open PR for it
+            self.hits += 1
+            return None
+
+        self.misses += 1
+        owner = repo.full_name.split("/")[0]
+        headers = {"If-None-Match": entry.etag} if entry and entry.etag else None
+        response_headers, data = repo._requester.requestJsonAndCheck(
+            "GET", f"{repo.url}/pulls", parameters={"state": "open", "head": f"{owner}:{branch_name}"}, headers=headers)
+        if data is None:
+            entry.checked_at = now
+            return entry.pr
+
+        pr = self._from_json(data[0]) if data else None
+        with self._lock:
+            self._entries[branch_name] = _Entry(pr, response_headers.get("etag"), now)
+        return pr
+
+    def warm(self, repo):
+        # One paginated listing of every open PR; used before fanning out batch work
+        entries = {}
+        now = time.time()
+        for pr in repo.get_pulls(state="open"):
+            entries[pr.head.ref] = _Entry(OpenPullRequest(pr.number, pr.html_url, pr.head.ref), None, now)
+        with self._lock:
+            self._entries = entries
+            self._listed_at = now
+        logger.info(f"Indexed {len(entries)} open pull requests of {repo.full_name}")
+
+    def record(self, branch_name, number, html_url):
+        with self._lock:
+            self._entries[branch_name] = _Entry(OpenPullRequest(number, html_url, branch_name), None, time.time())
+
+    def discard(self, branch_name):
+        with self._lock:
+            self._entries[branch_name] = _Entry(None, None, time.time())
+
+    def apply_event(self, payload):
+        # Feed from a GitHub `pull_request` webhook delivery
+        pull_request = payload.get("pull_request") or {}
+        branch_name = pull_request.get("head", {}).get("ref")
+        if not branch_name:
+            return
+        if payload.get("action") in ("opened", "reopened"):
+            self.record(branch_name, pull_request["number"], pull_request["html_url"])
+        elif payload.get("action") == "closed":
+            self.discard(branch_name)
+
+    def snapshot(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _from_json(data):
+        return OpenPullRequest(data["number"], data["html_url"], data["head"]["ref"])
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from content_cache import git_blob_sha
+
+logger = logging.getLogger(__name__)
+
+# GitHub truncates the commit list of a push payload at this many entries
+MAX_PUSH_COMMITS = 20
+
+PropagationPlan = namedtuple("PropagationPlan", ["comp_name", "env", "values", "updated_files",
+                                                 "image_tag_is_same", "pr_url", "blob_shas", "computed_at"])
+
+
+class Propagation:
+    # What the threaded (CreatePRAndAddLabel) and the asyncio engine share for one
+    # (comp_name, env) propagation: names, rule application and the state it reads and
+    # leaves behind. The engines differ only in how they talk to GitHub.
+    git_commit_prefix = "release"
+
+    def __init__(self, comp_name, env, rules):
+        self.comp_name = comp_name
+        self.env = env
+        self.env_to_be_updated = rules.target_env(env)
+        self.branch_name = f"{self.env_to_be_updated}-{comp_name}"
+        self.release_name = f"{self.env_to_be_updated}-{comp_name}"
+        self.files = rules.files_for(comp_name, env)
+        self.pr_url = None
+        self.pr_created = False
+        self.image_tag_is_same = False
+        self.values = {}
+        self.blob_shas = None
+        self.updated_files = {}
+
+    @property
+    def commit_message(self):
+        return f"{self.git_commit_prefix}: {self.branch_name} - Updating image tag for application {self.comp_name}"
+
+    @property
+    def pr_title(self):
+        return f"{self.git_commit_prefix}: {self.branch_name} - Update image tag for application {self.comp_name}"
+
+    @property
+    def labels(self):
+        return ["canary-pre", "env: pre", f"releaseName: {self.release_name}", f"appname: {self.comp_name}"]
+
+    def record_reads(self, source_shas, target_shas):
+        # {path: blob sha} of the source and target files the update is worked out from
+        self.blob_shas = (tuple(sorted(source_shas.items())), tuple(sorted(target_shas.items())))
+
+    def apply_rules(self, source_contents, target_contents):
+        # Each file is read once and all of its keys are rewritten together. Returns
+        # {target path: new content} for the files that change.
+        updated_files = {}
+        for rule, source_path, target_path in self.files:
+            content = updated_files.get(target_path, target_contents[target_path])
+            updated_content, unchanged, updates = rule.apply(source_contents[source_path], content, source_path)
+            self.values.setdefault(target_path, {}).update(updates)
+            logger.info(f"Values from {source_path} for {target_path}: "
+                        f"{ {'.'.join(map(str, path)): value for path, value in updates.items()} }")
+            if not unchanged:
+                updated_files[target_path] = updated_content
+        self.image_tag_is_same = not updated_files
+        self.updated_files = updated_files
+        return updated_files
+
+    def state(self, settled=False):
+        # (open PR url, source blob shas, target blob shas) as read, or with settled=True as
+        # they are once this propagation's commit is in place
+        if self.blob_shas is None:
+            return None
+        sources, targets = self.blob_shas
+        if settled and self.updated_files:
+            targets = dict(targets)
+            targets.update((path, git_blob_sha(content)) for path, content in self.updated_files.items())
+            targets = tuple(sorted(targets.items()))
+        return self.pr_url, sources, targets
+
+
+def pushed_paths(payload):
+    # Paths touched by a push webhook delivery, or None when the payload cannot list them all
+    commits = payload.get("commits") or []
+    if len(commits) >= MAX_PUSH_COMMITS or payload.get("forced"):
+        return None
+    paths = set()
+    for commit in commits:
+        for key in ("added", "modified", "removed"):
+            paths.update(commit.get(key) or [])
+    return paths
+
+
+class PlanStore:
+    # Propagation plans worked out ahead of time from webhook deliveries, keyed by the
+    # propagation branch name. A plan holds everything the read half of a propagation
+    # produces, so serving one leaves only the writes. Plans expire after ttl seconds and
+    # are dropped whenever a push or pull_request event touches their files or branch; a
+    # plan whose reads started before the latest invalidation is never stored.
+    def __init__(self, ttl=300, max_entries=2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._plans = OrderedDict()
+        self._invalidated_at = {}
+        self._cleared_at = 0
+        self._lock = threading.Lock()
+
+    def put(self, branch_name, plan):
+        with self._lock:
+            if plan.computed_at < max(self._invalidated_at.get(branch_name, 0), self._cleared_at):
+                logger.info(f"Discarding outdated propagation plan for {branch_name}")
+                return
+            self._plans[branch_name] = plan
+            self._plans.move_to_end(branch_name)
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+
+    def get(self, branch_name):
+        with self._lock:
+            plan = self._plans.get(branch_name)
+            if plan is None or time.time() - plan.computed_at >= self.ttl:
+                self._plans.pop(branch_name, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return plan
+
+    def invalidate(self, branch_name):
+        with self._lock:
+            self._plans.pop(branch_name, None)
+            self._invalidated_at[branch_name] = time.time()
+            self.invalidations += 1
+            if len(self._invalidated_at) > self.max_entries:
+                cutoff = time.time() - self.ttl
+                self._invalidated_at = {name: at for name, at in self._invalidated_at.items() if at >= cutoff}
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self._cleared_at = time.time()
+            self.invalidations += 1
+
+    def snapshot(self):
+        return {"plans": len(self._plans), "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations}
+
+
+class OutcomeCache:
+    # Result of the last finished propagation per (comp_name, env), stored with the state it
+    # left behind: open PR url plus source and target blob shas. A request that finds exactly
+    # that state again would change nothing, so its result is returned without queueing a job
+    # or touching the write path. Any new commit, blob or PR gives a different state.
+    def __init__(self, ttl=3600, max_entries=2000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._outcomes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, propagation):
+        return propagation in self._outcomes
+
+    def put(self, propagation, state, result):
+        with self._lock:
+            self._outcomes[propagation] = (state, result, time.time())
+            self._outcomes.move_to_end(propagation)
+            while len(self._outcomes) > self.max_entries:
+                self._outcomes.popitem(last=False)
+
+    def get(self, propagation, state):
+        with self._lock:
+            entry = self._outcomes.get(propagation)
+            if entry is None or entry[0] != state or time.time() - entry[2] >= self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def snapshot(self):
+        return {"outcomes": len(self._outcomes), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,154 @@
+import logging
+import re
+
+import yaml
+
+from tag_extractor import extract_values
+from tag_rewriter import key_path, locate_scalars, rewrite_values
+
+logger = logging.getLogger(__name__)
+
+# What the service has always propagated: image.imageTag of the immutable values file, sit -> pre -> prd
+DEFAULT_RULES = {
+    "promotions": {"sit": "pre", "pre": "prd"},
+    "files": [
+        {
+            "source": "manifests/{comp_name}/{env}/immutable/values.yaml",
+            "target": "manifests/{comp_name}/{target_env}/immutable/values.yaml",
+            "keys": ["image.imageTag"],
+        },
+    ],
+}
+_FIELD = re.compile(r"\{(\w+)\}")
+
+
+class MissingSourceValue(ValueError):
+    # The source file exists but holds none of the values a file rule propagates
+    pass
+
+
+def _template_regex(template, required, envs):
+    # Reverse of str.format for a path template, used to map pushed paths back to propagations
+    parts = _FIELD.split(template)
+    fields = set(parts[1::2])
+    unknown = fields - {"comp_name", "env", "target_env"}
+    if unknown or not required <= fields:
+        raise ValueError(f"Path template {template} must use {{{'}, {'.join(sorted(required))}}} "
+                         f"and no fields other than comp_name, env and target_env")
+    pattern = []
+    seen = set()
+    for index, part in enumerate(parts):
+        if index % 2 == 0:
+            pattern.append(re.escape(part))
+        elif part in seen:
+            pattern.append(f"(?P={part})")
+        else:
+            seen.add(part)
+            pattern.append(f"(?P<{part}>{'[^/]+' if part == 'comp_name' else '|'.join(map(re.escape, envs))})")
+    return re.compile("".join(pattern) + "$")
+
+
+class FileRule:
+    # One source/target file pair and the key paths copied from one to the other. A key is
+    # "a.b" (same path on both sides), {"source": "a.b", "target": "c.d"}, or a pattern with
+    # "*" segments that copies every matching scalar already present in the target.
+    def __init__(self, source, target, keys, envs):
+        self.source = source
+        self.target = target
+        self.keys = []
+        self.patterns = []
+        for key in keys:
+            if isinstance(key, dict):
+                source_key, target_key = key_path(key["source"]), key_path(key["target"])
+            else:
+                source_key = target_key = key_path(key)
+            if "*" in source_key or "*" in target_key:
+                if source_key != target_key:
+                    raise ValueError(f"Wildcard key {key} must be the same path in source and target")
+                self.patterns.append(source_key)
+            else:
+                self.keys.append((source_key, target_key))
+        if not self.keys and not self.patterns:
+            raise ValueError(f"No keys to propagate from {source}")
+        self.source_regex = _template_regex(source, {"comp_name", "env"}, envs)
+        self.target_regex = _template_regex(target, {"comp_name", "target_env"}, envs)
+
+    def updates(self, source_content, target_content, source_path="the source"):
+        # {target key path: value}; source keys that are missing or null are not propagated, and
+        # a source with none of the rule's values at all raises MissingSourceValue
+        values = extract_values(source_content, [source for source, _ in self.keys], self.patterns)
+        if not values:
+            keys = [".".join(source) for source, _ in self.keys] + [".".join(pattern) for pattern in self.patterns]
+            raise MissingSourceValue(f"{source_path} has no value for {', '.join(keys)}")
+        updates = {}
+        for source, target in self.keys:
+            if source in values:
+                updates[target] = values.pop(source)
+            else:
+                logger.warning(f"{'.'.join(source)} has no value in {source_path}, not propagated")
+        if values:
+            updates.update((path, values[path]) for path in locate_scalars(target_content, values))
+        return updates
+
+    def apply(self, source_content, target_content, source_path="the source"):
+        # (new target content, nothing changed, {target key path: value})
+        updates = self.updates(source_content, target_content, source_path)
+        if not updates:
+            return target_content, True, updates
+        updated_content, unchanged = rewrite_values(target_content, updates)
+        return updated_content, unchanged, updates
+
+
+class RuleSet:
+    # Declarative propagation rules compiled once at startup: which environment promotes to
+    # which, and for every file pair its path templates, their reverse-matching regexes and
+    # the parsed key paths. A propagation applies all of them in one read/rewrite/commit pass.
+    def __init__(self, promotions, files):
+        self.promotions = dict(promotions)
+        envs = sorted(set(self.promotions) | set(self.promotions.values()))
+        # Environments in promotion order (sit, pre, prd for the defaults)
+        self.environments = []
+        for env in [env for env in self.promotions if env not in self.promotions.values()] + envs:
+            while env is not None and env not in self.environments:
+                self.environments.append(env)
+                env = self.promotions.get(env)
+        self.files = [FileRule(rule["source"], rule["target"], rule["keys"], envs) for rule in files]
+        if not self.files:
+            raise ValueError("The propagation rule set has no file rules")
+
+    @classmethod
+    def load(cls, path=None):
+        # YAML or JSON file shaped like DEFAULT_RULES, or the defaults when path is empty
+        config = DEFAULT_RULES
+        if path:
+            with open(path) as file:
+                config = yaml.safe_load(file)
+        rules = cls(config["promotions"], config["files"])
+        logger.info(f"Loaded {len(rules.files)} propagation file rules for promotions {rules.promotions}")
+        return rules
+
+    def target_env(self, env):
+        return self.promotions.get(env)
+
+    def files_for(self, comp_name, env):
+        # [(rule, source path, target path)] for propagating comp_name from env
+        fields = {"comp_name": comp_name, "env": env, "target_env": self.promotions[env]}
+        return [(rule, rule.source.format(**fields), rule.target.format(**fields)) for rule in self.files]
+
+    def affected_propagations(self, paths):
+        # (comp_name, env) propagations with a source or target file in paths
+        propagations = set()
+        for path in paths:
+            for rule in self.files:
+                match = rule.source_regex.match(path)
+                if match:
+                    groups = match.groupdict()
+                    target_env = self.promotions.get(groups["env"])
+                    if target_env and groups.get("target_env", target_env) == target_env:
+                        propagations.add((groups["comp_name"], groups["env"]))
+                match = rule.target_regex.match(path)
+                if match:
+                    groups = match.groupdict()
+                    propagations.update((groups["comp_name"], source) for source, target in self.promotions.items()
+                                        if target == groups["target_env"] and groups.get("env", source) == source)
+        return propagations
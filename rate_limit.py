@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, retry_at):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+class RateLimitGovernor:
+    # Process-wide view of the GitHub API budget, refreshed from the X-RateLimit-* headers
+    # of every response (the headers carry the token-wide count, so workers in other
+    # processes are accounted for too). Batch and background calls stop once `remaining`
+    # falls to batch_reserve, interactive ones only at reserve, so user-facing
+    # propagations keep the tail of the budget. A secondary rate limit (403/429 with
+    # Retry-After or the "secondary rate limit" message) pauses everyone until it lifts.
+    # Callers that would have to wait longer than max_wait get RateLimitExceeded instead.
+    def __init__(self, reserve=50, batch_reserve=500, max_wait=60, secondary_backoff=60):
+        self.reserve = reserve
+        self.batch_reserve = batch_reserve
+        self.max_wait = max_wait
+        self.secondary_backoff = secondary_backoff
+        self.limit = None
+        self.remaining = None
+        self.reset_at = 0
+        self.blocked_until = 0
+        self.counters = {"calls": 0, "throttled": 0, "rejected": 0, "secondary_limits": 0, "primary_limits": 0}
+        self._waiting = {INTERACTIVE: 0, BATCH: 0}
+        self._local = threading.local()
+        self._changed = threading.Condition()
+
+    @contextmanager
+    def priority(self, priority):
+        # Calls made by this thread inside the block are budgeted as `priority`
+        previous = getattr(self._local, "priority", INTERACTIVE)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self):
+        return getattr(self._local, "priority", INTERACTIVE)
+
+    def delay(self, priority=None):
+        # Seconds to wait before a call of this priority may go out; 0 reserves the call
+        priority = priority or self.current_priority()
+        now = time.time()
+        with self._changed:
+            floor = self.reserve if priority == INTERACTIVE else self.batch_reserve
+            if now < self.blocked_until:
+                wait = self.blocked_until - now
+            elif self.remaining is not None and self.remaining <= floor and now < self.reset_at:
+                wait = self.reset_at - now
+            else:
+                self.counters["calls"] += 1
+                if self.remaining is not None:
+                    self.remaining -= 1
+                return 0
+            if wait > self.max_wait:
+                self.counters["rejected"] += 1
+                raise RateLimitExceeded(f"GitHub API budget exhausted for {priority} calls, "
+                                        f"{self.remaining} left until {time.ctime(now + wait)}", now + wait)
+            self.counters["throttled"] += 1
+            return wait
+
+    def acquire(self):
+        priority = self.current_priority()
+        while True:
+            wait = self.delay(priority)
+            if not wait:
+                return
+            logger.info(f"Holding {priority} GitHub call for {wait:.1f}s to stay within the rate limit")
+            with self._changed:
+                self._waiting[priority] += 1
+                try:
+                    self._changed.wait(wait)
+                finally:
+                    self._waiting[priority] -= 1
+
+    def observe(self, status, headers, body=""):
+        # Returns the seconds to wait before retrying if the response was rate limited
+        now = time.time()
+        retry_after = None
+        with self._changed:
+            if headers.get("X-RateLimit-Remaining") is not None:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+                self.limit = int(headers.get("X-RateLimit-Limit") or self.limit or 0)
+                self.reset_at = float(headers.get("X-RateLimit-Reset") or self.reset_at)
+            if status in (403, 429):
+                if headers.get("Retry-After") or "secondary rate limit" in (body or "").lower():
+                    retry_after = float(headers.get("Retry-After") or self.secondary_backoff)
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+                    self.counters["secondary_limits"] += 1
+                elif self.remaining == 0:
+                    retry_after = max(self.reset_at - now, 1)
+                    self.counters["primary_limits"] += 1
+            self._changed.notify_all()
+        if retry_after:
+            logger.warning(f"GitHub rate limited the request ({status}), backing off {retry_after:.0f}s")
+        return retry_after
+
+    def snapshot(self):
+        now = time.time()
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_in_seconds": max(self.reset_at - now, 0) if self.remaining is not None else None,
+            "blocked_for_seconds": max(self.blocked_until - now, 0),
+            "waiting": dict(self._waiting),
+            **self.counters,
+        }
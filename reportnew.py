@@ -1,57 +1,97 @@
 import boto3
 import requests
 import os
+import csv
 import json
-from datetime import datetime
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Define a list of regions
 # , 'us-west-2', 'eu-west-1', 'ap-south-1'
 regions = ['ap-southeast-1', 'us-west-2', 'eu-central-1']
+target_accounts = os.environ.get('INSPECTOR_TARGET_ACCOUNTS', '468896299932').split(',')
+# region -> scan ARN and ETag of the report already on disk
+report_cache_path = os.environ.get('INSPECTOR_REPORT_CACHE', '.report_cache.json')
+summary_path = os.environ.get('INSPECTOR_SUMMARY_PATH', 'report_summary.csv')
+# Columns identifying one finding; rows are deduplicated on those present in a report
+dedup_columns = ['Account ID', 'Check ID', 'Resource ID', 'Status']
+chunk_size = 1024 * 1024
+
+# One client per region and one HTTP session (keep-alive pool) for all report downloads
+_clients = {}
+_clients_lock = threading.Lock()
+_cache_lock = threading.Lock()
+http_session = requests.Session()
+http_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=len(regions)))
+
+
+def load_report_cache():
+    try:
+        with open(report_cache_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_report_cache(region, entry):
+    with _cache_lock:
+        cache = load_report_cache()
+        cache[region] = entry
+        with open(report_cache_path + '.tmp', 'w') as file:
+            json.dump(cache, file, indent=2)
+        os.replace(report_cache_path + '.tmp', report_cache_path)
+
+
+# Function to initialize the boto3 client, cached per region
+def get_inspector_client(region):
+    with _clients_lock:
+        if region in _clients:
+            return _clients[region]
+
+        aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
+        aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        # INSPECTOR_ENDPOINT_URL points the client at a local stand-in (e.g. moto server)
+        endpoint_url = os.environ.get('INSPECTOR_ENDPOINT_URL')
+
+        if aws_access_key_id and aws_secret_access_key:
+            client = boto3.client(
+                'inspector2',
+                region_name=region,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                endpoint_url=endpoint_url
+            )
+        else:
+            # If no environment variables, rely on the AWS CLI credentials configured via `aws configure`
+            client = boto3.client(
+                'inspector2',
+                region_name=region,
+                endpoint_url=endpoint_url
+            )
 
+        _clients[region] = client
+        return client
 
-def convert_datetime(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()  # Convert datetime to ISO 8601 string format
-    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
 
-
-# Function to initialize the boto3 client
-def get_inspector_client(region):
-    aws_access_key_id = os.environ.get('AWS_ACCESS_KEY_ID')
-    aws_secret_access_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-
-    if aws_access_key_id and aws_secret_access_key:
-        client = boto3.client(
-            'inspector2',
-            region_name=region,
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key
-        )
-    else:
-        # If no environment variables, rely on the AWS CLI credentials configured via `aws configure`
-        client = boto3.client(
-            'inspector2',
-            region_name=region
-        )
-
-    return client
+def list_cis_scans(client):
+    # Every page of list_cis_scans, not just the first
+    kwargs = {}
+    while True:
+        response = client.list_cis_scans(**kwargs)
+        yield from response.get('scans', [])
+        if not response.get('nextToken'):
+            return
+        kwargs['nextToken'] = response['nextToken']
 
 
 # Function to get the latest successful scan in a region
 def get_latest_successful_scan(region):
     client = get_inspector_client(region)
 
-    # List scans in the given region
-    response = client.list_cis_scans()
-
-    pretty_json = json.dumps(response, indent=4, default=convert_datetime)
-    print(pretty_json)
-
     # Check for successful scans
-    successful_scans = []
-    for scan in response.get('scans', []):
-        if scan['status'] == 'COMPLETED':
-            successful_scans.append(scan)
+    successful_scans = [scan for scan in list_cis_scans(client) if scan['status'] == 'COMPLETED']
+    print(f"{len(successful_scans)} successful scans found in {region}")
 
     # Sort by timestamp and return the latest scan ARN
     if successful_scans:
@@ -62,42 +102,107 @@ def get_latest_successful_scan(region):
 
 # Function to download the scan report
 def download_scan_report(region, scan_arn):
+    path = f'report_{region}.csv'
+    cached = load_report_cache().get(region) if os.path.exists(path) else None
+    if cached and cached.get('scanArn') == scan_arn:
+        print(f"Report for {scan_arn} in {region} is already downloaded")
+        return path
+
     client = get_inspector_client(region)
     # Request the report URL
     response = client.get_cis_scan_report(
         reportFormat='CSV',
         scanArn=scan_arn,
-        targetAccounts=['468896299932']
+        targetAccounts=target_accounts
     )
-
-    pretty_json = json.dumps(response, indent=4, default=convert_datetime)
-    print(f"url {pretty_json}")
-    # Download the report
-    if 'url' in response:
-        r = response['url']
-        res = requests.get(r)
-        if res.status_code == 200:
-            content = res.content
-            with open(f'report_{region}.csv', 'wb') as file:
-                file.write(content)
-            print(f"Report downloaded for {region}")
-        else:
-            print(f"Failed to download report for {region}")
-    else:
-        print(f"No URL found for scan ARN {scan_arn} in {region}")
-
-
-# Main logic to loop through regions and process each region
-def process_scans():
-    for region in regions:
-        print(f"Processing region: {region}")
-        scan_arn = get_latest_successful_scan(region)
-        if scan_arn:
-            print(f"Latest successful scan ARN found in {region}: {scan_arn}")
-            download_scan_report(region, scan_arn)
-        else:
-            print(f"No successful scans found in {region}")
+    if 'url' not in response:
+        print(f"No URL found for scan ARN {scan_arn} in {region} (status {response.get('status')})")
+        return None
+
+    # Streamed to a temporary file in chunks, so memory stays flat whatever the report size
+    headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+    with http_session.get(response['url'], headers=headers, stream=True, timeout=60) as res:
+        if res.status_code == 304:
+            print(f"Report for {region} is unchanged")
+            save_report_cache(region, {**cached, 'scanArn': scan_arn})
+            return path
+        if res.status_code != 200:
+            print(f"Failed to download report for {region} (HTTP {res.status_code})")
+            return None
+        with open(path + '.part', 'wb') as file:
+            for chunk in res.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+        os.replace(path + '.part', path)
+        save_report_cache(region, {'scanArn': scan_arn, 'etag': res.headers.get('ETag'), 'path': path})
+    print(f"Report downloaded for {region}")
+    return path
+
+
+def merge_reports(reports, output=None):
+    # Streams every regional CSV row by row into one summary with a Region column. Rows
+    # describing the same finding are kept once; only a digest of each key stays in memory.
+    output = output or summary_path
+    fieldnames = ['Region']
+    for path in reports.values():
+        with open(path, newline='') as file:
+            for name in next(csv.reader(file), []):
+                if name not in fieldnames:
+                    fieldnames.append(name)
+
+    seen = set()
+    counts = {'rows': 0, 'duplicates': 0}
+    statuses = {}
+    with open(output + '.part', 'w', newline='') as out:
+        writer = csv.DictWriter(out, fieldnames=fieldnames, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for region, path in reports.items():
+            with open(path, newline='') as file:
+                reader = csv.DictReader(file)
+                key_columns = [name for name in dedup_columns if name in (reader.fieldnames or [])]
+                for row in reader:
+                    values = [row.get(name) or '' for name in key_columns] if key_columns else list(row.values())
+                    digest = hashlib.sha1('\x1f'.join(map(str, values)).encode()).digest()
+                    if digest in seen:
+                        counts['duplicates'] += 1
+                        continue
+                    seen.add(digest)
+                    counts['rows'] += 1
+                    if row.get('Status'):
+                        statuses[row['Status']] = statuses.get(row['Status'], 0) + 1
+                    writer.writerow({**row, 'Region': region})
+    os.replace(output + '.part', output)
+    print(f"Merged {len(reports)} reports into {output}: {counts['rows']} findings, "
+          f"{counts['duplicates']} duplicates dropped, by status {statuses}")
+    return output
+
+
+def process_region(region):
+    print(f"Processing region: {region}")
+    scan_arn = get_latest_successful_scan(region)
+    if not scan_arn:
+        print(f"No successful scans found in {region}")
+        return None
+    print(f"Latest successful scan ARN found in {region}: {scan_arn}")
+    return download_scan_report(region, scan_arn)
+
+
+# Main logic: every region is processed concurrently; returns {region: report path or None}
+def process_scans(scan_regions=None, max_workers=None):
+    scan_regions = scan_regions or regions
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(scan_regions)) as executor:
+        futures = {region: executor.submit(process_region, region) for region in scan_regions}
+        for region, future in futures.items():
+            try:
+                results[region] = future.result()
+            except Exception as e:
+                print(f"Failed to process region {region}: {e}")
+                results[region] = None
+    return results
 
 
 # Run the process
-process_scans()
+if __name__ == '__main__':
+    reports = {region: path for region, path in process_scans().items() if path}
+    if reports:
+        merge_reports(reports)
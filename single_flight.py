@@ -0,0 +1,74 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    # One lock per key, created on first use and dropped once nobody holds or waits for it,
+    # so work on different keys never contends.
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def acquire(self, key, blocking=True):
+        # blocking=False lets an event loop poll for the lock instead of parking its thread
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        if entry[0].acquire(blocking):
+            return True
+        self._forget(key, entry)
+        return False
+
+    def release(self, key):
+        with self._lock:
+            entry = self._locks[key]
+        entry[0].release()
+        self._forget(key, entry)
+
+    def _forget(self, key, entry):
+        with self._lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class SingleFlight:
+    # key -> id of the task currently working on it. Identical requests that arrive while
+    # that task is queued or running are handed its id instead of starting their own.
+    def __init__(self):
+        self.started = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, start):
+        # start() launches the work and returns its task id; exceptions leave nothing behind.
+        # Returns (task_id, joined_existing).
+        with self._lock:
+            task_id = self._in_flight.get(key)
+            if task_id is not None:
+                self.coalesced += 1
+                return task_id, True
+            task_id = start()
+            self._in_flight[key] = task_id
+            self.started += 1
+            return task_id, False
+
+    def done(self, key, task_id):
+        with self._lock:
+            if self._in_flight.get(key) == task_id:
+                del self._in_flight[key]
+
+    def snapshot(self):
+        return {"in_flight": len(self._in_flight), "started": self.started, "coalesced": self.coalesced}
@@ -0,0 +1,58 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return {"count": self.count, "avg": round(avg, 4), "max": round(self.max, 4), "last": round(self.last, 4)}
+
+
+class StepTimer:
+    # histogram, when given, is a Prometheus histogram labelled (component, step)
+    def __init__(self, steps, component=None, histogram=None):
+        self.step_stats = {step: LatencyStats() for step in steps}
+        self.histograms = {step: histogram.labels(component, step) for step in steps} if histogram else {}
+
+    @contextmanager
+    def step(self, name, timings=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.step_stats[name].observe(elapsed)
+            if name in self.histograms:
+                self.histograms[name].observe(elapsed)
+            if timings is not None:
+                timings[name] = round(elapsed, 4)
+
+    def timed(self, name):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.step(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        return {step: stats.snapshot() for step, stats in self.step_stats.items()}
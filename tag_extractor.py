@@ -0,0 +1,30 @@
+from tag_rewriter import PlainScalar, key_path, locate_scalars, match_scalars
+
+IMAGE_TAG_PATH = ("image", "imageTag")
+_NULLS = ("", "~", "null", "Null", "NULL")
+
+
+def extract_value(content, path):
+    # Reads one scalar without loading the document: parsing stops once the top-level
+    # mapping holding it has been consumed. Plain scalars come back as the exact text in the
+    # file (so a tag like 1.10 is not turned into the float 1.1); nulls come back as None.
+    path = key_path(path)
+    return _value(locate_scalars(content, [path], stop_after=path[:1]).get(path))
+
+
+def extract_values(content, paths, patterns=()):
+    # Several values in one pass: {path: value} for the exact paths found plus every scalar
+    # matching one of the wildcard patterns; nulls are left out
+    found = match_scalars(content, set(paths) | set(patterns)) if patterns else locate_scalars(content, paths)
+    values = {path: _value(event) for path, event in found.items()}
+    return {path: value for path, value in values.items() if value is not None}
+
+
+def _value(event):
+    if event is None or (event.implicit[0] and event.value in _NULLS):
+        return None
+    return PlainScalar(event.value) if event.implicit[0] else event.value
+
+
+def extract_image_tag(content):
+    return extract_value(content, IMAGE_TAG_PATH)
@@ -0,0 +1,145 @@
+import logging
+
+import yaml
+from yaml.events import (AliasEvent, MappingEndEvent, MappingStartEvent, ScalarEvent, SequenceEndEvent,
+                         SequenceStartEvent)
+
+logger = logging.getLogger(__name__)
+
+# libyaml's event parser is an order of magnitude faster; its marks are character offsets too
+EventLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class _Frame:
+    __slots__ = ("is_mapping", "path", "key", "expect_key", "index")
+
+    def __init__(self, is_mapping, path):
+        self.is_mapping = is_mapping
+        self.path = path
+        self.key = None
+        self.expect_key = is_mapping
+        self.index = 0
+
+    def child_path(self):
+        return self.path + ((self.key,) if self.is_mapping else (self.index,))
+
+    def consumed(self):
+        if self.is_mapping:
+            self.expect_key = True
+        else:
+            self.index += 1
+
+
+def key_path(path):
+    return tuple(path.split(".")) if isinstance(path, str) else tuple(path)
+
+
+def _scalar_events(content, stop_after=None):
+    # (key path, event) for every value scalar, walking the YAML event stream without
+    # building a node tree; stops once the collection at stop_after has been fully consumed
+    stack = []
+    for event in yaml.parse(content, Loader=EventLoader):
+        if isinstance(event, (MappingStartEvent, SequenceStartEvent)):
+            path = stack[-1].child_path() if stack else ()
+            if stack:
+                stack[-1].consumed()
+            stack.append(_Frame(isinstance(event, MappingStartEvent), path))
+        elif isinstance(event, (MappingEndEvent, SequenceEndEvent)):
+            if stack.pop().path == stop_after:
+                return
+        elif isinstance(event, (ScalarEvent, AliasEvent)):
+            if not stack:
+                continue
+            frame = stack[-1]
+            if frame.is_mapping and frame.expect_key:
+                frame.key = event.value if isinstance(event, ScalarEvent) else None
+                frame.expect_key = False
+                continue
+            path = frame.child_path()
+            frame.consumed()
+            if isinstance(event, ScalarEvent):
+                yield path, event
+
+
+def locate_scalars(content, paths, stop_after=None):
+    # {path: ScalarEvent} for each requested key path, stopping as soon as all of them have
+    # been seen or once the collection at stop_after has been fully consumed.
+    targets = set(paths)
+    found = {}
+    for path, event in _scalar_events(content, stop_after):
+        if path in targets:
+            found[path] = event
+            if len(found) == len(targets):
+                break
+    return found
+
+
+def path_matches(pattern, path):
+    # "*" matches any single key or sequence index
+    return len(pattern) == len(path) and all(part == "*" or part == str(key) for part, key in zip(pattern, path))
+
+
+def match_scalars(content, patterns):
+    # {path: ScalarEvent} for every value scalar whose key path matches one of patterns
+    return {path: event for path, event in _scalar_events(content)
+            if any(path_matches(pattern, path) for pattern in patterns)}
+
+
+class PlainScalar(str):
+    # Text of an unquoted scalar in the file it was read from (tag_extractor), so writing it
+    # unquoted elsewhere resolves to the same type (1.10 stays a float, yes stays a bool)
+    pass
+
+
+def _plain_is_safe(value):
+    # value written unquoted must parse back as this same scalar: a string, unless it was
+    # itself read from an unquoted scalar
+    try:
+        loaded = yaml.load(f"k: {value}", Loader=EventLoader)
+    except yaml.YAMLError:
+        return False
+    if not isinstance(loaded, dict) or list(loaded) != ["k"]:
+        return False
+    return isinstance(value, PlainScalar) or (isinstance(loaded["k"], str) and loaded["k"] == value)
+
+
+def _render(value, style):
+    value = value if isinstance(value, PlainScalar) else str(value)
+    if style not in ('"', "'") and not _plain_is_safe(value):
+        style = '"'
+    if style == '"':
+        return '"%s"' % value.replace("\\", "\\\\").replace('"', '\\"')
+    if style == "'":
+        return "'%s'" % value.replace("'", "''")
+    return value
+
+
+def rewrite_values(content, updates):
+    # updates maps key paths ("image.imageTag" or tuples) to new values. Only the value
+    # scalars are sliced out and replaced, so indentation, quoting and comments survive.
+    # Returns (new_content, all_values_already_equal).
+    updates = {key_path(path): value for path, value in updates.items()}
+    found = locate_scalars(content, updates)
+    missing = [".".join(map(str, path)) for path in updates if path not in found]
+    if missing:
+        raise ValueError(f"Key path(s) {', '.join(missing)} not found")
+
+    parts = []
+    position = 0
+    all_same = True
+    for path, event in sorted(found.items(), key=lambda item: item[1].start_mark.index):
+        value = updates[path]
+        if event.value == str(value):
+            continue
+        all_same = False
+        parts.append(content[position:event.start_mark.index])
+        if event.start_mark.index and content[event.start_mark.index - 1] == ":":
+            # Empty value ("key:" with nothing after it): keep the key/value separator
+            parts.append(" ")
+        parts.append(_render(value, event.style))
+        position = event.end_mark.index
+
+    if all_same:
+        return content, True
+    parts.append(content[position:])
+    return "".join(parts), False
@@ -0,0 +1,181 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_PENDING = object()
+
+
+class MemoryTaskStore:
+    # Task results keyed by UUID, evicted after ttl seconds or least-recently-used once
+    # max_size is reached, so memory stays flat however many propagations are requested.
+    # wait() blocks on a condition variable that every write notifies.
+    def __init__(self, max_size=10000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._tasks = OrderedDict()
+        self._changed = threading.Condition()
+
+    def create(self):
+        task_id = uuid.uuid4().hex
+        self._put(task_id, _PENDING)
+        return task_id
+
+    def set(self, task_id, result):
+        self._put(task_id, result)
+
+    def get(self, task_id):
+        with self._changed:
+            result = self._lookup(task_id)
+            return None if result is _PENDING else result
+
+    def wait(self, task_id, timeout):
+        # Result of task_id once it is set, or None if it is still pending after timeout seconds.
+        # Unknown and expired tasks return None at once; tell them apart with `in`.
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                result = self._lookup(task_id)
+                if result is not _PENDING:
+                    return result
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def discard(self, task_id):
+        with self._changed:
+            self._tasks.pop(task_id, None)
+
+    def _lookup(self, task_id):
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self._tasks[task_id]
+            return None
+        self._tasks.move_to_end(task_id)
+        return entry[0]
+
+    def _put(self, task_id, result):
+        now = time.time()
+        with self._changed:
+            self._tasks[task_id] = (result, now + self.ttl)
+            self._tasks.move_to_end(task_id)
+            while self._tasks:
+                oldest_id, (_, expires_at) = next(iter(self._tasks.items()))
+                if len(self._tasks) <= self.max_size and expires_at >= now:
+                    break
+                del self._tasks[oldest_id]
+            self._changed.notify_all()
+
+    def __contains__(self, task_id):
+        with self._changed:
+            return self._lookup(task_id) is not None
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+class SqliteTaskStore:
+    # Same interface backed by a SQLite file in WAL mode, so every gunicorn worker on the
+    # host sees the same task status. Expired and overflowing rows are pruned on write.
+    # Writes from another process cannot notify us, so wait() re-reads every poll_interval.
+    prune_every = 100
+    poll_interval = 0.5
+
+    def __init__(self, path, max_size=10000, ttl=3600):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self._changed = threading.Condition()
+        # Not kept: the store may be created in a pre-fork master, and connections must not cross a fork
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY, result TEXT, updated_at REAL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at)")
+        finally:
+            conn.close()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self):
+        task_id = uuid.uuid4().hex
+        self._put(task_id, None)
+        return task_id
+
+    def set(self, task_id, result):
+        self._put(task_id, json.dumps(result))
+
+    def _row(self, task_id):
+        return self._connection().execute("SELECT result FROM tasks WHERE task_id = ? AND updated_at > ?",
+                                          (task_id, time.time() - self.ttl)).fetchone()
+
+    def get(self, task_id):
+        row = self._row(task_id)
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def wait(self, task_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._row(task_id)
+            remaining = deadline - time.monotonic()
+            if row is None:
+                return None
+            if row[0] is not None:
+                return json.loads(row[0])
+            if remaining <= 0:
+                return None
+            with self._changed:
+                self._changed.wait(min(self.poll_interval, remaining))
+
+    def discard(self, task_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+
+    def _put(self, task_id, value):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO tasks (task_id, result, updated_at) VALUES (?, ?, ?)",
+                         (task_id, value, time.time()))
+        with self._changed:
+            self._changed.notify_all()
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM tasks WHERE updated_at <= ?", (time.time() - self.ttl,))
+            conn.execute("DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks ORDER BY updated_at DESC "
+                         "LIMIT -1 OFFSET ?)", (self.max_size,))
+
+    def __contains__(self, task_id):
+        return self._row(task_id) is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+
+def create_task_store(path=None, max_size=10000, ttl=3600):
+    if path:
+        logger.info(f"Storing task results in {path}")
+        return SqliteTaskStore(path, max_size=max_size, ttl=ttl)
+    return MemoryTaskStore(max_size=max_size, ttl=ttl)
@@ -0,0 +1,56 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import time
+
+import pytest
+
+# The service modules live flat at the repository root, the fake GitHub API under benchmarks/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+WEBHOOK_SECRET = "webhook-secret"
+VALUES = "image:\n  imageTag: {}\n"
+
+
+@pytest.fixture(scope="session")
+def github():
+    from fake_github import FakeGithubServer
+
+    server = FakeGithubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope="session")
+def service(github):
+    # The service reads its configuration at import, so it is imported once against the fake API.
+    # Tests share its caches and use component names of their own.
+    os.environ.update(GITHUB_API_URL=github.url, GITHUB_TOKEN_PSW="token", GITHUB_WEBHOOK_SECRET=WEBHOOK_SECRET)
+    import CreatePrAndAddLabelRTL
+
+    return CreatePrAndAddLabelRTL
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
+
+
+def propagate(service, client, comp_name, env="sit", timeout=10):
+    # Result of GET /createpr once its task has finished
+    response = client.get("/rtlpropagation/v1.0/createpr", query_string={"comp_name": comp_name, "env": env})
+    task_id = re.search(r'const task_id = "(\w+)"', response.get_data(as_text=True)).group(1)
+    return service.task_results.wait(task_id, timeout)
+
+
+def deliver(client, event, payload, secret=WEBHOOK_SECRET):
+    # POST a webhook delivery signed the way GitHub signs it
+    body = json.dumps(payload).encode()
+    signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post("/rtlpropagation/v1.0/webhook", data=body, content_type="application/json",
+                       headers={"X-GitHub-Event": event, "X-Hub-Signature-256": signature})
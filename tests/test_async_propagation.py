@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from async_propagation import AsyncCreatePRAndAddLabel, AsyncPropagationRunner
+from conftest import VALUES
+from propagation_rules import RuleSet
+from single_flight import KeyedLocks
+
+
+@pytest.fixture
+def runner(github):
+    runner = AsyncPropagationRunner(github.url, "token", github.repo.full_name, rules=RuleSet.load(),
+                                    locks=KeyedLocks())
+    yield runner
+    runner.drain(5)
+
+
+def seed(github, comp_name, sit="2.0", pre="1.0"):
+    github.repo.commit_files("master", {f"manifests/{comp_name}/sit/immutable/values.yaml": VALUES.format(sit),
+                                        f"manifests/{comp_name}/pre/immutable/values.yaml": VALUES.format(pre)})
+
+
+def run(runner, comp_name, timeout=10):
+    outcome = {}
+    finished = threading.Event()
+
+    def done(creator, error):
+        outcome.update(creator=creator, error=error)
+        finished.set()
+
+    runner.submit(comp_name, "sit", done)
+    assert finished.wait(timeout)
+    return outcome["creator"], outcome["error"]
+
+
+def test_commits_and_raises_a_pr(runner, github):
+    seed(github, "async-new")
+    creator, error = run(runner, "async-new")
+    assert error is None
+    assert creator.pr_url.endswith(f"/pull/{creator.pr_number}")
+    assert github.repo.files_at("pre-async-new")["manifests/async-new/pre/immutable/values.yaml"] == \
+        github.repo.put_blob(VALUES.format("2.0").encode())
+    assert github.repo.labels[creator.pr_number] == creator.labels
+
+    # A second run finds the PR and has nothing left to change
+    creator, error = run(runner, "async-new")
+    assert error is None and creator.pr_created and creator.image_tag_is_same
+
+
+def test_adopts_a_pr_raised_concurrently(runner, github, monkeypatch):
+    seed(github, "async-race")
+    real_open_pull = AsyncCreatePRAndAddLabel.open_pull
+    calls = []
+
+    async def open_pull(self):
+        calls.append(self.branch_name)
+        if len(calls) == 1:
+            # Someone else raises the PR between our lookup and our create
+            github.repo.refs[self.branch_name] = github.repo.refs["master"]
+            github.repo.pulls.append({"number": len(github.repo.pulls) + 1, "state": "open", "title": "theirs",
+                                      "head": self.branch_name, "base": "master"})
+            return None
+        return await real_open_pull(self)
+
+    monkeypatch.setattr(AsyncCreatePRAndAddLabel, "open_pull", open_pull)
+    creator, error = run(runner, "async-race")
+    assert error is None
+    assert creator.pr_number == len(github.repo.pulls)
+    assert len(calls) == 2
+
+
+def test_waits_for_the_branch_lock(runner, github):
+    seed(github, "async-locked")
+    finished = threading.Event()
+    with runner.locks.hold("pre-async-locked"):
+        runner.submit("async-locked", "sit", lambda creator, error: finished.set())
+        assert not finished.wait(0.5)
+    assert finished.wait(10)
+    assert len(runner.locks) == 0
@@ -0,0 +1,76 @@
+import io
+import subprocess
+
+import pytest
+
+import commit_message_validation as validation
+
+
+def git(cwd, *args, input=None):
+    env = {"GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t", "GIT_COMMITTER_NAME": "t",
+           "GIT_COMMITTER_EMAIL": "t@t", "HOME": str(cwd), "PATH": "/usr/bin:/bin:/usr/local/bin"}
+    return subprocess.run(["git", *args], cwd=cwd, input=input, env=env, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "commit", "-q", "--allow-empty", "-m", "feat: ABC-1 base")
+    return tmp_path
+
+
+def commit_tree(repo, message):
+    # Like the Git Data API: the message is stored exactly as given, without a trailing newline
+    tree = git(repo, "rev-parse", "HEAD^{tree}")
+    sha = git(repo, "commit-tree", tree, "-p", "HEAD", "-F", "-", input=message)
+    git(repo, "update-ref", "HEAD", sha)
+    return sha
+
+
+def test_messages_without_trailing_newline_are_separate_records(repo):
+    commit_tree(repo, "fix: ABC-2 first")
+    bad = commit_tree(repo, "bad message")
+    commit_tree(repo, "docs: ABC-3 third\n\nwith a body")
+    commit_tree(repo, "release: ABC-4 fourth")
+
+    messages = list(validation.git_log_messages("HEAD~4..HEAD", cwd=repo))
+    checked, violations = validation.validate(messages)
+
+    assert checked == 4
+    assert violations == [validation.Violation(bad[:12], "bad message")]
+    assert messages[1][1] == "docs: ABC-3 third\n\nwith a body"
+
+
+def test_cli_exit_status_reports_every_violation(repo, monkeypatch, capsys):
+    commit_tree(repo, "oops one")
+    git(repo, "commit", "-q", "--allow-empty", "-m", "oops two")
+    monkeypatch.chdir(repo)
+
+    assert validation.main(["--range", "HEAD~2..HEAD"]) == 1
+    out = capsys.readouterr().out
+    assert "'oops one'" in out and "'oops two'" in out
+    assert "2 of 2 commit messages are invalid" in out
+
+
+def test_unknown_range_is_an_error(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    assert validation.main(["--range", "nope..HEAD"]) == 2
+
+
+def test_jsonl_stream():
+    stream = io.StringIO('{"sha": "a1", "message": "feat: ABC-12 add"}\n{"sha": "b2", "message": "oops"}\n'
+                         '\nnot json\n"fix: X-1 plain string"\n')
+    checked, violations = validation.validate(validation.jsonl_messages(stream))
+    assert checked == 4
+    assert violations == [validation.Violation("b2", "oops"), validation.Violation("line 4", "")]
+
+
+def test_jsonl_values_that_are_not_messages_are_violations(tmp_path, capsys):
+    path = tmp_path / "messages.jsonl"
+    path.write_text('123\n[1]\nnull\n{"sha": "c3", "message": 5}\n{"sha": "d4", "message": "docs: DOC-7 readme"}\n')
+    assert validation.main(["--jsonl", str(path)]) == 1
+    out = capsys.readouterr().out
+    assert "4 of 5 commit messages are invalid" in out
+    for ref in ("line 1", "line 2", "line 3", "c3"):
+        assert f"{ref}: ''" in out
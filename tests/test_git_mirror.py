@@ -0,0 +1,84 @@
+import subprocess
+import time
+
+import pytest
+
+from git_mirror import GitMirror, StaleMirror
+
+VALUES = "manifests/a/sit/immutable/values.yaml"
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd,
+                          check=True, capture_output=True, text=True).stdout
+
+
+def push(work, branch, tag):
+    (work / VALUES).write_text(f"image:\n  imageTag: {tag}\n")
+    git("add", ".", cwd=work)
+    git("commit", "-qm", tag, cwd=work)
+    git("push", "-q", "origin", f"HEAD:{branch}", cwd=work)
+
+
+@pytest.fixture
+def remote(tmp_path):
+    # A local bare repository stands in for the manifest remote
+    bare, work = tmp_path / "remote.git", tmp_path / "work"
+    git("init", "-q", "--bare", str(bare))
+    git("init", "-q", str(work))
+    (work / VALUES).parent.mkdir(parents=True)
+    git("remote", "add", "origin", f"file://{bare}", cwd=work)
+    push(work, "main", "v1")
+    return work
+
+
+@pytest.fixture
+def mirror(remote, tmp_path):
+    mirror = GitMirror(git("remote", "get-url", "origin", cwd=remote).strip(), str(tmp_path / "mirror.git"),
+                       refresh_interval=3600)
+    with pytest.raises(StaleMirror):
+        mirror.branch_head("main")
+    # Wait for the background clone; nothing refreshes again unless a test asks
+    for _ in range(100):
+        if mirror.fetched_at:
+            break
+        time.sleep(0.05)
+    yield mirror
+    with mirror._batch_lock:
+        mirror._close_batch()
+
+
+def test_reads_are_served_from_the_clone(mirror, remote):
+    head = mirror.branch_head("main")
+    assert head.commit_sha == git("rev-parse", "HEAD", cwd=remote).strip()
+    cached = mirror.get(VALUES, "main")
+    assert cached.decoded_content == "image:\n  imageTag: v1\n"
+    assert mirror.get(VALUES, "main") is cached
+    with pytest.raises(FileNotFoundError):
+        mirror.get("manifests/b/sit/immutable/values.yaml", "main")
+    assert mirror.counters["fallbacks"] == 1
+
+
+def test_dirty_branch_falls_back_until_fetched(mirror, remote):
+    push(remote, "main", "v2")
+    mirror.mark_dirty("main")
+    with pytest.raises(StaleMirror):
+        mirror.get(VALUES, "main")
+    mirror.refresh()
+    assert mirror.get(VALUES, "main").decoded_content == "image:\n  imageTag: v2\n"
+
+
+def test_branch_created_since_the_fetch_falls_back(mirror, remote):
+    push(remote, "pre-a", "v3")
+    # Not "missing": the API has to be asked, and LookupError is what read_manifest falls back on
+    with pytest.raises(LookupError):
+        mirror.branch_head("pre-a")
+    with pytest.raises(StaleMirror):
+        mirror.get(VALUES, "pre-a")
+    mirror.refresh()
+    assert mirror.get(VALUES, "pre-a").decoded_content == "image:\n  imageTag: v3\n"
+
+
+def test_token_stays_off_the_command_line(tmp_path):
+    mirror = GitMirror("https://example.invalid/manifests.git", str(tmp_path), token="secret")
+    assert mirror._git("config", "--get", "http.extraHeader", cwd=False).startswith("Authorization: Basic ")
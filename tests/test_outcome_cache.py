@@ -0,0 +1,46 @@
+from conftest import VALUES, deliver, propagate
+
+WRITES = ("create_blob", "create_tree", "create_commit", "create_ref", "update_ref", "create_pull", "set_labels")
+
+
+def writes(github):
+    return {name: count for name, count in github.calls.items() if name in WRITES}
+
+
+def test_settled_outcome_is_memoized_until_the_repository_moves(service, client, github):
+    github.repo.commit_files("master", {"manifests/memo/sit/immutable/values.yaml": VALUES.format("2.0"),
+                                        "manifests/memo/pre/immutable/values.yaml": VALUES.format("1.0")})
+    first = propagate(service, client, "memo")
+    assert "pr_url" in first
+
+    # Only a locally computed blob sha equal to GitHub's lets the settled state match
+    hits = service.outcome_cache.hits
+    github.calls.clear()
+    second = propagate(service, client, "memo")
+    assert "has been raised already and has the same image tag" in second["message"]
+    assert service.outcome_cache.hits == hits + 1
+    assert writes(github) == {}
+
+    # Closing the PR drops its url from the key, so the next request raises a new one
+    pull = next(pr for pr in github.repo.pulls if pr["head"] == "pre-memo" and pr["state"] == "open")
+    pull["state"] = "closed"
+    response = deliver(client, "pull_request", {
+        "action": "closed", "repository": {"full_name": github.repo.full_name},
+        "pull_request": {"number": pull["number"], "head": {"ref": "pre-memo"}}})
+    assert response.status_code == 202
+    hits = service.outcome_cache.hits
+    reopened = propagate(service, client, "memo")
+    assert service.outcome_cache.hits == hits
+    assert reopened["pr_url"] != first["pr_url"]
+    assert propagate(service, client, "memo")["message"].endswith("same image tag of sit")
+
+    # A new sit commit changes the source sha and is propagated onto the open PR
+    github.repo.commit_files("master", {"manifests/memo/sit/immutable/values.yaml": VALUES.format("3.0")})
+    hits = service.outcome_cache.hits
+    github.calls.clear()
+    moved = propagate(service, client, "memo")
+    assert service.outcome_cache.hits == hits
+    assert moved["pr_url"] == reopened["pr_url"]
+    assert writes(github)["create_commit"] == 1
+    assert github.repo.files_at("pre-memo")["manifests/memo/pre/immutable/values.yaml"] == \
+        github.repo.put_blob(VALUES.format("3.0").encode())
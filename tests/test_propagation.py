@@ -0,0 +1,57 @@
+from conftest import VALUES, propagate
+
+
+def test_missing_source_file_is_an_error(service, client, github):
+    github.repo.commit_files("master", {"manifests/onlypre/pre/immutable/values.yaml": VALUES.format("1.0")})
+
+    result = propagate(service, client, "onlypre")
+    assert "manifests/onlypre/sit/immutable/values.yaml not found" in result["error"]
+    assert ("onlypre", "sit") not in service.outcome_cache
+
+    response = client.get("/rtlpropagation/v1.0/plan", query_string={"comp_name": "onlypre", "env": "sit"})
+    assert response.status_code == 404
+
+
+def test_source_without_a_value_is_an_error(service, client, github):
+    github.repo.commit_files("master", {"manifests/notag/sit/immutable/values.yaml": "image:\n  repository: r\n",
+                                        "manifests/notag/pre/immutable/values.yaml": VALUES.format("1.0")})
+
+    result = propagate(service, client, "notag")
+    assert result == {"error": "manifests/notag/sit/immutable/values.yaml has no value for image.imageTag"}
+    assert ("notag", "sit") not in service.outcome_cache
+
+    response = client.get("/rtlpropagation/v1.0/plan", query_string={"comp_name": "notag", "env": "sit"})
+    assert response.status_code == 422
+    assert "no value for image.imageTag" in response.get_json()["error"]
+
+
+def test_changed_tag_raises_a_pr(service, client, github):
+    github.repo.commit_files("master", {"manifests/fresh/sit/immutable/values.yaml": VALUES.format("2.0"),
+                                        "manifests/fresh/pre/immutable/values.yaml": VALUES.format("1.0")})
+
+    result = propagate(service, client, "fresh")
+    assert result["pr_url"].endswith("/pull/%d" % len(github.repo.pulls))
+    assert github.repo.files_at("pre-fresh")["manifests/fresh/pre/immutable/values.yaml"] == \
+        github.repo.put_blob(VALUES.format("2.0").encode())
+
+
+def test_async_completion_always_releases_the_in_flight_key(service, monkeypatch):
+    class Runner:
+        def submit(self, comp_name, env, callback):
+            creator = service.CreatePRAndAddLabel(comp_name, env)
+            creator.pr_url, creator.pr_number = "https://example/pull/1", 1
+            callback(creator, None)
+
+    def broken(creator):
+        raise RuntimeError("outcome cache unavailable")
+
+    monkeypatch.setattr(service, "async_runner", Runner())
+    monkeypatch.setattr(service, "remember_outcome", broken)
+    key = ("async-broken", "sit")
+    task_id, joined = service.in_flight.run(key, service.task_results.create)
+    service.submit_async_propagation(task_id, *key)
+
+    assert service.task_results.get(task_id) == {"error": "outcome cache unavailable"}
+    next_task_id, joined = service.in_flight.run(key, service.task_results.create)
+    assert not joined and next_task_id != task_id
+    service.in_flight.done(key, next_task_id)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from async_propagation import AsyncGithub
+from rate_limit import BATCH, INTERACTIVE, RateLimitExceeded, RateLimitGovernor
+
+
+def headers(remaining, reset_in=30, **extra):
+    return {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(time.time() + reset_in), **extra}
+
+
+def test_batch_calls_are_held_at_the_batch_reserve():
+    governor = RateLimitGovernor(reserve=10, batch_reserve=100, max_wait=60)
+    governor.observe(200, headers(100))
+    assert 25 < governor.delay(BATCH) <= 30
+    assert governor.delay(INTERACTIVE) == 0
+    assert governor.remaining == 99
+    with governor.priority(BATCH):
+        assert governor.delay() > 0
+    assert governor.counters["throttled"] == 2
+
+    governor.observe(200, headers(10))
+    assert governor.delay(INTERACTIVE) > 0
+
+
+def test_secondary_limit_blocks_everyone():
+    governor = RateLimitGovernor(max_wait=120, secondary_backoff=45)
+    assert governor.observe(403, headers(4000, **{"Retry-After": "20"})) == 20
+    assert 15 < governor.delay(INTERACTIVE) <= 20
+    assert 15 < governor.delay(BATCH) <= 20
+
+    governor = RateLimitGovernor(max_wait=120, secondary_backoff=45)
+    assert governor.observe(403, headers(4000), "You have exceeded a Secondary Rate Limit") == 45
+    assert governor.delay(INTERACTIVE) > 40
+    assert governor.counters["secondary_limits"] == 1
+
+
+def test_waits_longer_than_max_wait_are_rejected():
+    governor = RateLimitGovernor(reserve=10, max_wait=5)
+    governor.observe(200, headers(5, reset_in=600))
+    with pytest.raises(RateLimitExceeded) as raised:
+        governor.delay(INTERACTIVE)
+    assert raised.value.retry_at > time.time() + 500
+    assert governor.counters["rejected"] == 1
+
+
+def test_plain_forbidden_is_not_a_rate_limit():
+    governor = RateLimitGovernor()
+    assert governor.observe(403, headers(4000), '{"message": "Resource not accessible by integration"}') is None
+    assert governor.delay(INTERACTIVE) == 0
+    assert governor.counters["secondary_limits"] == governor.counters["primary_limits"] == 0
+
+
+def test_plain_forbidden_is_not_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(403, headers=headers(4000), json={"message": "Must have admin rights"})
+
+    async def request():
+        github = AsyncGithub("https://github.invalid", "token", governor=RateLimitGovernor())
+        github.client = httpx.AsyncClient(base_url="https://github.invalid", transport=httpx.MockTransport(handler))
+        try:
+            await github.request("GET", "/repos/o/r")
+        finally:
+            await github.close()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(request())
+    assert calls == ["/repos/o/r"]
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import KeyedLocks, SingleFlight
+
+
+def test_identical_submit_joins_the_first():
+    flight = SingleFlight()
+    ids = iter(["t1", "t2"])
+    assert flight.run(("foo", "sit"), lambda: next(ids)) == ("t1", False)
+    assert flight.run(("foo", "sit"), lambda: next(ids)) == ("t1", True)
+    assert flight.run(("bar", "sit"), lambda: next(ids)) == ("t2", False)
+    assert flight.snapshot() == {"in_flight": 2, "started": 2, "coalesced": 1}
+
+
+def test_done_with_a_stale_id_leaves_the_key_alone():
+    flight = SingleFlight()
+    flight.run("key", lambda: "old")
+    flight.done("key", "old")
+    flight.run("key", lambda: "new")
+    flight.done("key", "old")
+    assert flight.run("key", lambda: "newer") == ("new", True)
+    flight.done("key", "new")
+    assert flight.run("key", lambda: "newer") == ("newer", False)
+
+
+def test_failed_start_leaves_nothing_behind():
+    flight = SingleFlight()
+
+    def start():
+        raise RuntimeError("queue full")
+
+    with pytest.raises(RuntimeError):
+        flight.run("key", start)
+    assert flight.snapshot() == {"in_flight": 0, "started": 0, "coalesced": 0}
+    assert flight.run("key", lambda: "t1") == ("t1", False)
+
+
+def test_lock_entries_are_dropped_once_released():
+    locks = KeyedLocks()
+    with locks.hold("a"):
+        with locks.hold("b"):
+            assert len(locks) == 2
+        assert len(locks) == 1
+    assert len(locks) == 0
+
+    assert locks.acquire("a", blocking=False)
+    assert not locks.acquire("a", blocking=False)
+    assert len(locks) == 1
+    locks.release("a")
+    assert len(locks) == 0
+
+
+def test_same_key_is_serialised_and_waiters_keep_the_entry():
+    locks = KeyedLocks()
+    order = []
+    entered = threading.Event()
+
+    def worker(name):
+        with locks.hold("branch"):
+            entered.set()
+            order.append(f"{name} in")
+            time.sleep(0.1)
+            order.append(f"{name} out")
+
+    first = threading.Thread(target=worker, args=("first",))
+    first.start()
+    entered.wait()
+    second = threading.Thread(target=worker, args=("second",))
+    second.start()
+    first.join()
+    second.join()
+    assert order == ["first in", "first out", "second in", "second out"]
+    assert len(locks) == 0
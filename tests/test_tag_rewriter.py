@@ -0,0 +1,53 @@
+import yaml
+
+from tag_extractor import extract_value, extract_values
+from tag_rewriter import PlainScalar, rewrite_values
+
+
+def test_empty_value_gets_a_separator():
+    content = "image:\n  imageTag:\n  pullPolicy: Always\n"
+    updated, same = rewrite_values(content, {"image.imageTag": PlainScalar("1.2.3")})
+    assert not same
+    assert updated == "image:\n  imageTag: 1.2.3\n  pullPolicy: Always\n"
+    assert yaml.safe_load(updated)["image"]["imageTag"] == "1.2.3"
+
+
+def test_empty_value_at_end_of_file():
+    updated, _ = rewrite_values("image:\n  imageTag:", {"image.imageTag": PlainScalar("v2")})
+    assert yaml.safe_load(updated) == {"image": {"imageTag": "v2"}}
+
+
+def test_quoted_source_string_is_quoted_in_plain_target():
+    value = extract_value('flags:\n  enabled: "yes"\n', "flags.enabled")
+    updated, _ = rewrite_values("flags:\n  enabled: no  # keep\n", {"flags.enabled": value})
+    assert updated == 'flags:\n  enabled: "yes"  # keep\n'
+    assert yaml.safe_load(updated)["flags"]["enabled"] == "yes"
+
+
+def test_plain_source_keeps_its_type():
+    value = extract_value("image:\n  imageTag: 1.10\n", "image.imageTag")
+    updated, _ = rewrite_values("image:\n  imageTag: 1.9\n", {"image.imageTag": value})
+    assert updated == "image:\n  imageTag: 1.10\n"
+
+
+def test_strings_that_would_not_parse_back_are_quoted():
+    content = "image:\n  imageTag: old\n"
+    for value, expected in (("1.10", '"1.10"'), ("a: b", '"a: b"'), ("x # y", '"x # y"'), ("", '""'),
+                            ("null", '"null"'), ("v1.2.3", "v1.2.3")):
+        updated, _ = rewrite_values(content, {"image.imageTag": value})
+        assert updated == f"image:\n  imageTag: {expected}\n"
+        assert yaml.safe_load(updated)["image"]["imageTag"] == value
+
+
+def test_quoting_style_and_comments_survive():
+    content = "image:\n  imageTag: 'v1'  # pinned\nother: 1\n"
+    updated, same = rewrite_values(content, {"image.imageTag": "v2"})
+    assert (updated, same) == ("image:\n  imageTag: 'v2'  # pinned\nother: 1\n", False)
+    assert rewrite_values(updated, {"image.imageTag": "v2"}) == (updated, True)
+
+
+def test_extract_values_marks_plain_scalars():
+    values = extract_values('a: 1\nb: "2"\nc: ~\n', [("a",), ("b",), ("c",)])
+    assert isinstance(values[("a",)], PlainScalar)
+    assert not isinstance(values[("b",)], PlainScalar)
+    assert ("c",) not in values
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from task_store import MemoryTaskStore, SqliteTaskStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryTaskStore(ttl=60)
+    return SqliteTaskStore(str(tmp_path / "tasks.db"), ttl=60)
+
+
+def test_unknown_task_does_not_block(store):
+    started = time.monotonic()
+    assert store.wait("missing", 5) is None
+    assert time.monotonic() - started < 1
+    assert "missing" not in store
+
+
+def test_pending_task_waits_and_is_known(store):
+    task_id = store.create()
+    assert store.wait(task_id, 0.2) is None
+    assert task_id in store
+    store.set(task_id, {"pr_url": "u"})
+    assert store.wait(task_id, 5) == {"pr_url": "u"}
+
+
+def test_expired_task_is_unknown():
+    store = MemoryTaskStore(ttl=0.05)
+    task_id = store.create()
+    time.sleep(0.1)
+    assert task_id not in store
+    assert store.wait(task_id, 5) is None
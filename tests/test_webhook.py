@@ -0,0 +1,71 @@
+import time
+
+from conftest import deliver
+from propagation_plans import PlanStore, PropagationPlan
+
+
+def plan(comp_name, computed_at):
+    return PropagationPlan(comp_name, "sit", {}, {}, False, None, {}, computed_at)
+
+
+def test_plan_read_before_an_invalidation_is_dropped():
+    store = PlanStore()
+    started = time.time() - 1
+    store.invalidate("pre-stale")
+    store.put("pre-stale", plan("stale", started))
+    assert store.get("pre-stale") is None
+
+    store.put("pre-stale", plan("stale", time.time()))
+    assert store.get("pre-stale").comp_name == "stale"
+
+
+def test_plan_read_before_a_clear_is_dropped():
+    store = PlanStore()
+    started = time.time() - 1
+    store.put("pre-kept", plan("kept", started))
+    store.clear()
+    assert store.get("pre-kept") is None
+
+    store.put("pre-other", plan("other", started))
+    assert store.get("pre-other") is None
+
+
+def test_unsigned_or_forged_deliveries_are_rejected(client, github):
+    payload = {"zen": "hi", "repository": {"full_name": github.repo.full_name}}
+    assert deliver(client, "ping", payload).status_code == 200
+    assert deliver(client, "ping", payload, secret="guessed").status_code == 401
+
+    response = client.post("/rtlpropagation/v1.0/webhook", json=payload, headers={"X-GitHub-Event": "ping"})
+    assert response.status_code == 401
+
+
+def test_webhooks_are_refused_without_a_secret(service, client, github, monkeypatch):
+    monkeypatch.setattr(service, "WEBHOOK_SECRET", None)
+    response = deliver(client, "ping", {"repository": {"full_name": github.repo.full_name}})
+    assert response.status_code == 403
+    assert "GITHUB_WEBHOOK_SECRET" in response.get_json()["error"]
+    assert not service.webhook_signature_valid(b"{}", "sha256=")
+
+
+def test_push_to_a_propagation_branch_drops_its_plan(service, client, github):
+    started = time.time() - 1
+    service.plan_store.put("pre-hooked", plan("hooked", started))
+    response = deliver(client, "push", {
+        "ref": "refs/heads/pre-hooked", "after": "0" * 40, "commits": [],
+        "repository": {"full_name": github.repo.full_name, "default_branch": github.repo.default_branch}})
+    assert response.status_code == 202
+    assert service.plan_store.get("pre-hooked") is None
+
+    # A plan whose reads were already under way when the push arrived is not stored either
+    service.plan_store.put("pre-hooked", plan("hooked", started))
+    assert service.plan_store.get("pre-hooked") is None
+
+
+def test_forced_push_to_the_default_branch_drops_every_plan(service, client, github):
+    started = time.time() - 1
+    service.plan_store.put("pre-forced", plan("forced", started))
+    response = deliver(client, "push", {
+        "ref": f"refs/heads/{github.repo.default_branch}", "after": "0" * 40, "forced": True, "commits": [],
+        "repository": {"full_name": github.repo.full_name, "default_branch": github.repo.default_branch}})
+    assert response.status_code == 202
+    assert service.plan_store.get("pre-forced") is None